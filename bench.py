@@ -0,0 +1,248 @@
+"""
+Benchmarks of the solvers and the simulator.
+
+Every benchmark is run "repeat" times and then once more under
+tracemalloc to measure the peak memory, and its result is printed as
+a line of JSON. Save the output of one commit and pass it to --compare
+when running another commit to see the ratio of the times.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Iterator
+
+import policyeval
+import rolls
+import thousand
+
+Benchmark = tuple[str, dict[str, Any], Callable[[], Callable[[], int]]]
+
+
+def policyeval_benchmarks() -> Iterator[Benchmark]:
+    for dice_count, sides in [(4, 6), (6, 6), (8, 6), (10, 6), (6, 10), (6, 12)]:
+        for numeric in ("fraction", "integer"):
+
+            def setup(dice_count=dice_count, sides=sides, numeric=numeric):
+                def run() -> int:
+                    policyeval.solve_game(
+                        dice_count, sides, lambda s: s % 7, "array", numeric
+                    )
+                    return 1
+
+                return run
+
+            yield "policyeval.solve_game", {
+                "dice_count": dice_count,
+                "sides": sides,
+                "numeric": numeric,
+            }, setup
+
+
+def outcomes_benchmarks() -> Iterator[Benchmark]:
+    for dice_count, sides in [(6, 6), (10, 6), (6, 12)]:
+
+        def setup(dice_count=dice_count, sides=sides):
+            def run() -> int:
+                # Time the enumeration itself, not the cached table.
+                rolls.outcome_table.cache_clear()
+                return sum(1 for o in rolls.outcomes(sides, dice_count))
+
+            return run
+
+        yield "rolls.outcomes", {"dice_count": dice_count, "sides": sides}, setup
+
+
+def strategy_benchmarks() -> Iterator[Benchmark]:
+    dice_count = sides = 6
+
+    def setup() -> Callable[[], int]:
+        values, strategy = policyeval.solve_game(
+            dice_count, sides, lambda s: s % 7, "array", "integer"
+        )
+        queries = [
+            (outcome, s)
+            for n in range(1, dice_count + 1)
+            for outcome in rolls.outcome_table(sides, n).outcomes
+            for s in range((dice_count - n) * (sides - 1) + 1)
+        ]
+
+        def run() -> int:
+            for outcome, s in queries:
+                strategy(outcome, s)
+            return len(queries)
+
+        return run
+
+    yield "policyeval.StrategyTable", {"dice_count": dice_count, "sides": sides}, setup
+
+
+def scaled_rules(goal: int) -> thousand.Rules:
+    """The default rules with the opening and endgame scaled to "goal"."""
+    unit = thousand.DEFAULT_RULES.unit
+    return thousand.Rules(
+        goal=goal,
+        endgame=goal * 9 // 10 // unit * unit,
+        opening=goal // 10 // unit * unit,
+    ).check()
+
+
+def thousand_benchmarks(goals: list[int]) -> Iterator[Benchmark]:
+    dice_count, sides = 6, 6
+    params = {"dice_count": dice_count, "sides": sides}
+    # The whole game at the default goal takes much longer, and the time
+    # grows with about the square of the goal.
+    for goal in goals:
+        rules = scaled_rules(goal)
+        for numeric in ("fraction", "float"):
+
+            def setup_solve(rules=rules, numeric=numeric) -> Callable[[], int]:
+                def run() -> int:
+                    thousand.solve_game(
+                        dice_count, sides, lambda s: s, rules=rules, numeric=numeric
+                    )
+                    return rules.max_score
+
+                return run
+
+            solve_params = dict(params, goal=goal, numeric=numeric)
+            yield "thousand.solve_game", solve_params, setup_solve
+
+        def setup_turns(rules=rules) -> Callable[[], int]:
+            def run() -> int:
+                values, strategy, iterations = thousand.solve_turns(
+                    dice_count, sides, rules=rules
+                )
+                return rules.max_score
+
+            return run
+
+        yield "thousand.solve_turns", dict(params, goal=goal), setup_turns
+
+    games = 200
+
+    def setup_play_game() -> Callable[[], int]:
+        thousand.random.seed(0)
+
+        def run() -> int:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(games):
+                    thousand.play_game(dice_count, sides, thousand.max_strategy)
+            return games
+
+        return run
+
+    yield "thousand.play_game", params, setup_play_game
+
+    def setup_simulator() -> Callable[[], int]:
+        simulator = thousand.Simulator(dice_count, sides, thousand.max_strategy, 0)
+
+        def run() -> int:
+            simulator.play_games(games * 10)
+            return games * 10
+
+        return run
+
+    yield "thousand.Simulator", params, setup_simulator
+
+
+def run_benchmark(setup: Callable[[], Callable[[], int]], repeat: int) -> dict:
+    run = setup()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        items = run()
+        times.append(time.perf_counter() - t)
+    run = setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "median": statistics.median(times),
+        "repeat": repeat,
+        "items_per_second": items / min(times),
+        "peak_bytes": peak,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-k", "--filter", help="only run benchmarks with this name")
+    parser.add_argument(
+        "--thousand-goals",
+        type=int,
+        nargs="+",
+        default=[1000, 2000, 3000],
+        help="goals of the games to solve in thousand",
+    )
+    parser.add_argument(
+        "--compare", type=argparse.FileType("r"), help="output of an earlier run"
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare is not None:
+        for line in args.compare:
+            result = json.loads(line)
+            key = result["name"], json.dumps(result["params"], sort_keys=True)
+            baseline[key] = result
+
+    benchmarks = itertools.chain(
+        policyeval_benchmarks(),
+        outcomes_benchmarks(),
+        strategy_benchmarks(),
+        thousand_benchmarks(args.thousand_goals),
+    )
+    commit = git_commit()
+    for name, params, setup in benchmarks:
+        if args.filter is not None and args.filter not in name:
+            continue
+        result = {"name": name, "params": params}
+        result.update(run_benchmark(setup, args.repeat))
+        result["commit"] = commit
+        result["python"] = platform.python_version()
+        print(json.dumps(result), flush=True)
+        key = name, json.dumps(params, sort_keys=True)
+        if key in baseline:
+            print(
+                "%s %s: %.3fs, %.2fx the time of %s"
+                % (
+                    name,
+                    params,
+                    result["seconds"],
+                    result["seconds"] / baseline[key]["seconds"],
+                    baseline[key]["commit"],
+                ),
+                file=sys.stderr,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,189 @@
+import argparse
 import fractions
-from math import factorial
+from typing import NamedTuple, Sequence
+
+Probability = int | fractions.Fraction | float
+
+
+class ChainResult(NamedTuple):
+    """
+    For dice_count dice that each succeed with probability p, where the
+    dice that succeed are set aside and the rest are thrown again until
+    none of them succeed: the expected number of successes, the
+    probability that all the dice succeed, and the expected number of
+    successes if we start over with all the dice whenever they all succeed.
+    """
+
+    expected_successes: Probability
+    all_succeed: Probability
+    with_startovers: Probability
+
+
+# _binomial_rows[n][k] is n choose k.
+_binomial_rows: list[list[int]] = [[1]]
+
+
+def binomial_row(n: int) -> list[int]:
+    """
+    >>> binomial_row(4)
+    [1, 4, 6, 4, 1]
+    """
+    while len(_binomial_rows) <= n:
+        prev = _binomial_rows[-1]
+        _binomial_rows.append([a + b for a, b in zip([0] + prev, prev + [0])])
+    return _binomial_rows[n]
+
+
+def chain_rows_float(p: float, dice_count: int) -> tuple[list[float], list[float]]:
+    """
+    The expected number of successes and the probability that all
+    succeed, with n = 0, 1, ..., dice_count dice.
+    """
+    q = 1 - p
+    p_pow = [1.0]
+    q_pow = [1.0]
+    for k in range(dice_count):
+        p_pow.append(p_pow[-1] * p)
+        q_pow.append(q_pow[-1] * q)
+    count = [0.0]
+    all_prob = [1.0]
+    for n in range(1, dice_count + 1):
+        row = binomial_row(n)
+        t_count = t_all_prob = 0.0
+        for k in range(1, n + 1):
+            # k successes
+            outcome_prob = row[k] * p_pow[k] * q_pow[n - k]
+            t_all_prob += all_prob[n - k] * outcome_prob
+            t_count += (k + count[n - k]) * outcome_prob
+        count.append(t_count)
+        all_prob.append(t_all_prob)
+    return count, all_prob
+
+
+def chain_rows_integer(
+    p: fractions.Fraction, dice_count: int
+) -> tuple[list[int], list[int]]:
+    """
+    Same as chain_rows_float, but exact: the values with n dice are
+    returned as integers to be divided by b**(n*(n+1)//2), where
+    p = a/b. Outcomes with n dice are multiples of 1/b**n, so this is
+    a common denominator, and the rows are computed without any gcd.
+    """
+    a, b = p.numerator, p.denominator
+    c = b - a
+    a_pow = [1]
+    b_pow = [1]
+    c_pow = [1]
+    for k in range(dice_count):
+        a_pow.append(a_pow[-1] * a)
+        b_pow.append(b_pow[-1] * b)
+        c_pow.append(c_pow[-1] * c)
+    count = [0]
+    all_prob = [1]
+    # b**(1 + 2 + ... + (n-1))
+    scale = 1
+    for n in range(1, dice_count + 1):
+        row = binomial_row(n)
+        t_count = t_all_prob = 0
+        # The values with n-k dice are multiples of 1/b**(T(n-k)), where
+        # T(m) = 1 + ... + m, so they are scaled up by b**(T(n-1)-T(n-k)).
+        rescale = 1
+        for k in range(1, n + 1):
+            outcome = row[k] * a_pow[k] * c_pow[n - k]
+            t_all_prob += all_prob[n - k] * rescale * outcome
+            t_count += (k * scale + count[n - k] * rescale) * outcome
+            rescale *= b_pow[n - k]
+        count.append(t_count)
+        all_prob.append(t_all_prob)
+        scale *= b_pow[n]
+    return count, all_prob
+
+
+def solve_chains(
+    configurations: Sequence[tuple[int, Probability]], numeric: str = "fraction"
+) -> list[ChainResult]:
+    """
+    The ChainResult of each (dice_count, p) in "configurations".
+    The values with fewer dice do not depend on dice_count,
+    so every distinct p is solved once up to the largest dice_count.
+    With numeric="fraction", the results are exact; with
+    numeric="float", they are floats.
+
+    >>> exact, coin = solve_chains([(6, fractions.Fraction(1, 6)), (1, 0.5)])
+    >>> exact.all_succeed
+    Fraction(1301320229387, 76169967501312)
+    >>> coin.with_startovers
+    Fraction(3, 2)
+    >>> (approx,) = solve_chains([(6, 1 / 6)], "float")
+    >>> abs(approx.with_startovers - exact.with_startovers) < 1e-12
+    True
+
+    With no dice, all of them always succeed, and we would start over
+    forever:
+
+    >>> solve_chains([(0, 0.5)])
+    Traceback (most recent call last):
+      ...
+    ValueError: Need at least one die: 0
+    """
+    for dice_count, p in configurations:
+        if dice_count < 1:
+            raise ValueError("Need at least one die: %r" % (dice_count,))
+        if not 0 <= p < 1:
+            raise ValueError("Probability must be in [0, 1): %r" % (p,))
+    if numeric == "fraction":
+        exact = [(n, fractions.Fraction(p)) for n, p in configurations]
+        max_exact: dict[fractions.Fraction, int] = {}
+        for dice_count, q in exact:
+            max_exact[q] = max(max_exact.get(q, 0), dice_count)
+        integer_rows = {q: chain_rows_integer(q, n) for q, n in max_exact.items()}
+        results = []
+        for dice_count, q in exact:
+            count, all_prob = integer_rows[q]
+            den = q.denominator ** (dice_count * (dice_count + 1) // 2)
+            results.append(
+                chain_result(
+                    dice_count,
+                    fractions.Fraction(count[dice_count], den),
+                    fractions.Fraction(all_prob[dice_count], den),
+                )
+            )
+        return results
+    elif numeric == "float":
+        approx = [(n, float(p)) for n, p in configurations]
+        max_approx: dict[float, int] = {}
+        for dice_count, x in approx:
+            max_approx[x] = max(max_approx.get(x, 0), dice_count)
+        float_rows = {x: chain_rows_float(x, n) for x, n in max_approx.items()}
+        return [
+            chain_result(
+                dice_count,
+                float_rows[x][0][dice_count],
+                float_rows[x][1][dice_count],
+            )
+            for dice_count, x in approx
+        ]
+    else:
+        raise ValueError("Unknown numeric mode %r" % (numeric,))
+
+
+def chain_result(dice_count: int, e: Probability, a: Probability) -> ChainResult:
+    # W.p. a, we start over (add "dice_count" to success);
+    # w.p. 1-a, we don't (with exp. success e).
+    # Thus total number of successes X is
+    # X = a * (dice_count + X) + (1-a) * e.
+    # X * (1 - a) = dice_count * a + (1-a) * e.
+    x = (dice_count * a + (1 - a) * e) / (1 - a)
+    return ChainResult(e, a, x)
 
 
 def main() -> None:
-    dice_count = 6
-    sides = 6
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dice", type=int, default=6)
+    parser.add_argument("--sides", type=int, default=6)
+    args = parser.parse_args()
+    dice_count = args.dice
+    sides = args.sides
     p = fractions.Fraction(1, sides)
 
     no_success = (1 - p) ** dice_count
@@ -12,42 +191,11 @@ def main() -> None:
         "Pr[no successes in first try] = %s\n= %.2f" % (no_success, float(no_success))
     )
 
-    count: list[int | fractions.Fraction] = [0]
-    all_prob: list[int | fractions.Fraction] = [1]
-    for n in range(1, dice_count + 1):
-        # Suppose we have n dice left.
-        # Each outcome corresponds to a number of successes.
-        t_count: int | fractions.Fraction = 0
-        t_all_prob: int | fractions.Fraction = 0
-        prob_sum: int | fractions.Fraction = 0
-        for outcome in range(0, n + 1):
-            # "outcome" successes.
-            outcome_multiplicity = factorial(n) // (
-                factorial(outcome) * factorial(n - outcome)
-            )
-            outcome_prob = outcome_multiplicity * p**outcome * (1 - p) ** (n - outcome)
-            if outcome == 0:
-                # It ends now.
-                t_all_prob += 0 * outcome_prob
-                t_count += 0 * outcome_prob
-            else:
-                t_all_prob += all_prob[n - outcome] * outcome_prob
-                t_count += (outcome + count[n - outcome]) * outcome_prob
-            prob_sum += outcome_prob
-        assert prob_sum == 1, (n, prob_sum)
-        print("E[#successes with %d dice] = %s" % (n, t_count))
-        print("Pr[all %d dice succeed] = %s" % (n, t_all_prob))
-        count.append(t_count)
-        all_prob.append(t_all_prob)
-    # W.p. all_prob[-1], we start over (add "dice_count" to success);
-    # w.p. 1-all_prob[-1], we don't (with exp. success count[-1]).
-    # Thus total number of successes X is
-    # X = all_prob[-1] * (dice_count + X) + (1-all_prob[-1]) * count[-1].
-    # X * (1 - all_prob[-1]) = dice_count * all_prob[-1] +
-    #                          (1-all_prob[-1]) * count[-1].
-    X = (dice_count * all_prob[-1] + (1 - all_prob[-1]) * count[-1]) / (
-        1 - all_prob[-1]
-    )
+    results = solve_chains([(n, p) for n in range(1, dice_count + 1)])
+    for n, result in enumerate(results, 1):
+        print("E[#successes with %d dice] = %s" % (n, result.expected_successes))
+        print("Pr[all %d dice succeed] = %s" % (n, result.all_succeed))
+    X = results[-1].with_startovers
     print(
         "E[#successes with %d dice and startovers] =\n%s\n= %.2f"
         % (dice_count, X, float(X))
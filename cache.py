@@ -0,0 +1,165 @@
+"""
+On-disk cache of solved games.
+
+A cache file holds a small JSON header followed by binary sections,
+and is memory-mapped when it is read back, so loading a solution does
+not depend on the size of the table.  Values are stored exactly as
+Fractions packed by pack_fractions and are only decoded when accessed.
+
+Cache files are named by a hash of the game, the solver version,
+the number of dice and sides, the table of utilities and the variant
+of the rules, so changing any of these (or bumping SOLVER_VERSION in
+the solver) gives a new file.
+"""
+
+import array
+import fractions
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections.abc import Iterable, Sequence
+
+MAGIC = b"30game\n"
+
+
+def cache_dir() -> str:
+    return os.environ.get("THIRTYGAME_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "30game"
+    )
+
+
+def cache_path(
+    game: str,
+    version: int,
+    dice_count: int,
+    sides: int,
+    utility_row: Sequence[int | fractions.Fraction],
+    variant: tuple = (),
+) -> str:
+    """
+    "variant" describes any other parameters of the game, such as
+    its rules, and is left out of the key when it is empty.
+    """
+    key_fields: tuple = (game, version, dice_count, sides, list(utility_row))
+    if variant:
+        key_fields += (variant,)
+    key = repr(key_fields)
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(cache_dir(), "%s-%s.bin" % (game, digest[:32]))
+
+
+def pack_fractions(
+    values: Iterable[int | fractions.Fraction | float],
+) -> tuple[array.array, bytes]:
+    """
+    Returns (offsets, data) where the numerator of the i'th value is
+    data[offsets[2*i]:offsets[2*i+1]] and the denominator is
+    data[offsets[2*i+1]:offsets[2*i+2]].
+
+    >>> offsets, data = pack_fractions([fractions.Fraction(-1, 300), 2])
+    >>> list(PackedFractions(memoryview(offsets), data))
+    [Fraction(-1, 300), Fraction(2, 1)]
+    """
+    offsets = array.array("Q", [0])
+    data = bytearray()
+    for v in values:
+        v = fractions.Fraction(v)
+        data += v.numerator.to_bytes(
+            (v.numerator.bit_length() + 8) // 8, "little", signed=True
+        )
+        offsets.append(len(data))
+        data += v.denominator.to_bytes((v.denominator.bit_length() + 7) // 8, "little")
+        offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+class PackedFractions(Sequence[fractions.Fraction]):
+    """
+    Read-only sequence of the Fractions packed by pack_fractions,
+    decoded on access.  Slicing gives a view that shares the buffers.
+    """
+
+    def __init__(
+        self, offsets: memoryview, data: bytes | memoryview, start: int = 0, stop=None
+    ) -> None:
+        self._offsets = offsets.cast("B").cast("Q")
+        self._data = data
+        self._start = start
+        self._stop = (len(self._offsets) - 1) // 2 if stop is None else stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            assert step == 1
+            return PackedFractions(
+                self._offsets, self._data, self._start + start, self._start + stop
+            )
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        a, b, c = self._offsets[2 * (self._start + i) : 2 * (self._start + i) + 3]
+        return fractions.Fraction(
+            int.from_bytes(self._data[a:b], "little", signed=True),
+            int.from_bytes(self._data[b:c], "little"),
+        )
+
+
+def write_tables(path: str, meta: dict, sections: dict[str, bytes]) -> None:
+    """
+    Write "meta" and the named binary sections to "path".
+    The file is written under a temporary name and then renamed, so
+    readers never see a partially written cache file.
+    """
+    header_sections = {}
+    offset = 0
+    for name, section in sections.items():
+        header_sections[name] = [offset, len(section)]
+        # Keep every section 8-byte aligned.
+        offset += -(-len(section) // 8) * 8
+    header = json.dumps({"meta": meta, "sections": header_sections}).encode()
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % 8)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as fp:
+        fp.write(MAGIC)
+        fp.write(struct.pack("<Q", len(header)))
+        fp.write(header)
+        for section in sections.values():
+            fp.write(section)
+            fp.write(b"\0" * (-len(section) % 8))
+    os.replace(tmp_path, path)
+
+
+def read_tables(path: str) -> tuple[dict, dict[str, memoryview]] | None:
+    """
+    Memory-map a file written by write_tables and return its meta
+    and sections, or None if there is no valid cache file.
+    """
+    try:
+        with open(path, "rb") as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(buf)
+    start = len(MAGIC) + 8
+    if len(view) < start or view[: len(MAGIC)] != MAGIC:
+        return None
+    (header_length,) = struct.unpack("<Q", view[len(MAGIC) : start])
+    try:
+        header = json.loads(bytes(view[start : start + header_length]))
+    except ValueError:
+        return None
+    start += header_length
+    sections = {
+        name: view[start + offset : start + offset + length]
+        for name, (offset, length) in header["sections"].items()
+    }
+    if any(start + o + n > len(view) for o, n in header["sections"].values()):
+        return None
+    return header["meta"], sections
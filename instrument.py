@@ -0,0 +1,160 @@
+"""
+Optional counters and timers for the solvers, and progress reporting.
+
+The solvers call count, timer and wrap at a few places that are not
+innermost loops. These do nothing unless they are called within
+"with instrumented() as i:", after which i.dump() gives what was
+counted and how long was spent in each timer.
+
+    >>> with instrumented() as i:
+    ...     count("cells", 3)
+    ...     with timer("solve"):
+    ...         f = wrap("strategy", abs)
+    ...         f(-1), f(2)
+    (1, 2)
+    >>> sorted(i.dump()["counters"].items())
+    [('cells', 3), ('solve', 1), ('strategy', 2)]
+    >>> wrap("strategy", abs) is abs
+    True
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import sys
+import time
+from typing import Any, Callable, ContextManager, Iterator, TextIO, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Called with the amount of work done so far and the total amount.
+Progress = Callable[[int, int], None]
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        self.counters: collections.Counter[str] = collections.Counter()
+        self.seconds: collections.defaultdict[str, float] = collections.defaultdict(
+            float
+        )
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        self.counters[name] += 1
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - t
+
+    def wrap(self, name: str, f: F) -> F:
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with self.timer(name):
+                return f(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    def dump(self) -> dict:
+        return {"counters": dict(self.counters), "seconds": dict(self.seconds)}
+
+
+_active: Instrumentation | None = None
+
+
+@contextlib.contextmanager
+def instrumented() -> Iterator[Instrumentation]:
+    global _active
+    previous = _active
+    _active = Instrumentation()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+@contextlib.contextmanager
+def dump_on_exit(enabled: bool, file: TextIO | None = None) -> Iterator[None]:
+    """
+    If "enabled", instrument the body and print the dump as JSON
+    (to stderr by default) when it exits, even on Ctrl-C.
+    """
+    if not enabled:
+        yield
+        return
+    with instrumented() as i:
+        try:
+            yield
+        finally:
+            print(json.dumps(i.dump()), file=file or sys.stderr, flush=True)
+
+
+def count(name: str, n: int = 1) -> None:
+    if _active is not None:
+        _active.counters[name] += n
+
+
+def timer(name: str) -> ContextManager[None]:
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.timer(name)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    Decorator that counts and times the calls to a function
+    while instrumentation is active.
+    """
+
+    def decorator(f: F) -> F:
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return f(*args, **kwargs)
+            with _active.timer(name):
+                return f(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def wrap(name: str, f: F) -> F:
+    """
+    Count and time the calls to f, if instrumentation is active when
+    wrap is called.
+    """
+    if _active is None:
+        return f
+    return _active.wrap(name, f)
+
+
+class ProgressPrinter:
+    """
+    A Progress that prints how far along we are and the estimated time
+    left, at most once every "interval" seconds and when done.
+    """
+
+    def __init__(
+        self, label: str, file: TextIO | None = None, interval: float = 1.0
+    ) -> None:
+        self.label = label
+        self.file = file
+        self.interval = interval
+        self.started = time.monotonic()
+        self.printed = -interval
+
+    def __call__(self, done: int, total: int) -> None:
+        now = time.monotonic()
+        if done < total and now - self.printed < self.interval:
+            return
+        self.printed = now
+        elapsed = now - self.started
+        eta = elapsed * (total - done) / done if done else float("nan")
+        print(
+            "%s: %.1f%% done in %.0fs, %.0fs left"
+            % (self.label, 100 * done / (total or 1), elapsed, eta),
+            file=self.file or sys.stdout,
+            flush=True,
+        )
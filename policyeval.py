@@ -1,29 +1,123 @@
+import array
 import fractions
-from typing import Callable, Sequence
+import functools
+import math
+import operator
+from typing import Any, Callable, Sequence, cast
 
-from rolls import outcomes
+import cache
+import instrument
+from rolls import outcome_rank, outcome_table
+
+# Bump this whenever a change to the solver changes its results,
+# so that solutions cached by cached_solve_game are recomputed.
+SOLVER_VERSION = 1
 
 Strategy = Callable[[Sequence[int], int], Sequence[int]]
 Utility = Callable[[int], int | fractions.Fraction]
-RollValueFunction = Callable[[Sequence[int], int], int | fractions.Fraction]
+# A value in a table: an int or a Fraction, a float with numeric="float",
+# or an int that is scaled by common_denominator with numeric="integer".
+Value = int | fractions.Fraction | float
+RollValueFunction = Callable[[Sequence[int], int], Value]
+Divide = Callable[[Any, int], Value]
+
+
+def exact_divide(a: int, b: int) -> int:
+    """
+    >>> exact_divide(12, 4)
+    3
+    """
+    q, r = divmod(a, b)
+    assert r == 0, (a, b)
+    return q
+
+
+def common_denominator(
+    dice_count: int, sides: int, utility_row: Sequence[Value]
+) -> int:
+    """
+    Row n is computed from rows 0, ..., n-1 and divided by sides**n,
+    so every value in the table is a multiple of
+    1 / (utility denominator * sides**(1 + 2 + ... + dice_count)).
+
+    >>> common_denominator(2, 6, [fractions.Fraction(1, 2), 1])
+    432
+    """
+    d = math.lcm(*(fractions.Fraction(u).denominator for u in utility_row))
+    return d * sides ** (dice_count * (dice_count + 1) // 2)
+
+
+def scale_values(scale: int, values: Sequence[Sequence[Value]]) -> list[Sequence[int]]:
+    return [[int(v * scale) for v in row] for row in values]
+
+
+def unscale_values(
+    scale: int, values: Sequence[Sequence[int]]
+) -> list[Sequence[fractions.Fraction]]:
+    return [[fractions.Fraction(v, scale) for v in row] for row in values]
 
 
+def unscale_table(
+    utility_row: Sequence[Value], scale: int, values: Sequence[Sequence[Value]]
+) -> list[Sequence[Value]]:
+    """
+    The table solved with numeric="integer", whose rows after the first
+    are ints scaled by "scale", with Fractions in those rows instead.
+    """
+    rows: list[Sequence[Value]] = [utility_row]
+    rows.extend(unscale_values(scale, cast(Sequence[Sequence[int]], values[1:])))
+    return rows
+
+
+def initial_values(
+    dice_count: int,
+    sides: int,
+    utility_row: Sequence[Value],
+    numeric: str,
+) -> tuple[list[Sequence[Value]], Divide, int]:
+    """
+    Returns the row for n = 0 in the representation used by "numeric",
+    the function used to divide rows by sides**n and the scale
+    of the representation.
+    """
+    rows: list[Sequence[Value]]
+    if numeric == "fraction":
+        rows = [utility_row]
+        return rows, fractions.Fraction, 1
+    elif numeric == "integer":
+        scale = common_denominator(dice_count, sides, utility_row)
+        rows = [*scale_values(scale, [utility_row])]
+        return rows, exact_divide, scale
+    elif numeric == "float":
+        float_row: list[float] = [float(u) for u in utility_row]
+        rows = [float_row]
+        return rows, operator.truediv, 1
+    else:
+        raise ValueError("Unknown numeric mode %r" % (numeric,))
+
+
+@instrument.timed("policyeval.compute_values_single_row")
 def compute_values_single_row(
     n: int,
     dice_count: int,
     sides: int,
     strategy: Strategy,
-    values: Sequence[Sequence[int | fractions.Fraction]],
-) -> Sequence[fractions.Fraction]:
+    values: Sequence[Sequence[Value]],
+    divide: Divide = fractions.Fraction,
+) -> Sequence[Value]:
     assert len(values) >= n - 1
     assert n >= 1
     # What might the accumulated sum be at most with n dice remaining?
     max_sum = (dice_count - n) * (sides - 1)
     # At the end, tmp_value[s] will be k**n times the expected utility.
-    tmp_value: list[int | fractions.Fraction] = [0 for s in range(max_sum + 1)]
+    tmp_value: list[Value] = [0 for s in range(max_sum + 1)]
+    strategy = instrument.wrap("policyeval.strategy", strategy)
 
-    for outcome, multiplicity in outcomes(sides, n):
-        outcome_sum = sum(outcome)
+    table = outcome_table(sides, n)
+    instrument.count("policyeval.cells", len(table.outcomes) * (max_sum + 1))
+    for outcome, multiplicity, outcome_sum in zip(
+        table.outcomes, table.multiplicities, table.sums
+    ):
         for s in range(0, max_sum + 1):
             reroll = strategy(outcome, s)
             reroll_sum = sum(reroll)
@@ -31,31 +125,310 @@ def compute_values_single_row(
             reroll_value = values[len(reroll)][s + keep_sum]
             tmp_value[s] += multiplicity * reroll_value
 
-    return [fractions.Fraction(a, sides**n) for a in tmp_value]
+    with instrument.timer("policyeval.divide"):
+        return [divide(a, sides**n) for a in tmp_value]
 
 
 def compute_values(
-    dice_count: int, sides: int, strategy: Strategy, utility: Utility
-) -> Sequence[Sequence[int | fractions.Fraction]]:
+    dice_count: int,
+    sides: int,
+    strategy: Strategy,
+    utility: Utility,
+    numeric: str = "fraction",
+) -> Sequence[Sequence[Value]]:
     # values[n][s] == v means that for n remaining dice,
     # accumulated sum s, the expected utility is v.
-    values: list[Sequence[int | fractions.Fraction]] = []
     # Fill out "values" for n = 0 using the utility function.
-    values.append([utility(s) for s in range(dice_count * (sides - 1) + 1)])
+    utility_row = [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+    values, divide, scale = initial_values(dice_count, sides, utility_row, numeric)
     for n in range(1, dice_count + 1):
-        values.append(compute_values_single_row(n, dice_count, sides, strategy, values))
+        values.append(
+            compute_values_single_row(n, dice_count, sides, strategy, values, divide)
+        )
+    if numeric == "integer":
+        values = unscale_table(utility_row, scale, values)
     return values
 
 
+def evaluate_strategies(
+    dice_count: int,
+    sides: int,
+    strategies: Sequence[Strategy],
+    utility: Utility,
+    numeric: str = "fraction",
+) -> list[Sequence[Sequence[Value]]]:
+    """
+    Same as [compute_values(dice_count, sides, s, utility, numeric)
+    for s in strategies], but all the strategies are evaluated in the same
+    pass over the outcomes and states. A StrategyTable is read directly
+    instead of being called.
+
+    >>> u = lambda s: s % 4
+    >>> values, table = solve_game(3, 4, u)
+    >>> def greedy(outcome, s):
+    ...     return outcome[:-1]
+    >>> a, b = evaluate_strategies(3, 4, [table, greedy], u)
+    >>> a == values, b == compute_values(3, 4, greedy, u)
+    (True, True)
+    >>> a[3][0] > b[3][0]
+    True
+    """
+    utility_row = [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+    values, divide, scale = initial_values(dice_count, sides, utility_row, numeric)
+    tables = [list(values) for strategy in strategies]
+    for n in range(1, dice_count + 1):
+        rows = compute_values_single_rows(
+            n, dice_count, sides, strategies, tables, divide
+        )
+        for values, row in zip(tables, rows):
+            values.append(row)
+    if numeric == "integer":
+        return [unscale_table(utility_row, scale, t) for t in tables]
+    return list(tables)
+
+
+@instrument.timed("policyeval.compute_values_single_rows")
+def compute_values_single_rows(
+    n: int,
+    dice_count: int,
+    sides: int,
+    strategies: Sequence[Strategy],
+    tables: Sequence[Sequence[Sequence[Value]]],
+    divide: Divide = fractions.Fraction,
+) -> list[Sequence[Value]]:
+    """
+    compute_values_single_row for several strategies at once,
+    going through the outcomes and sums only once.
+    """
+    assert n >= 1
+    max_sum = (dice_count - n) * (sides - 1)
+    tmp_values: list[list[Value]] = [
+        [0 for s in range(max_sum + 1)] for values in tables
+    ]
+    # For a StrategyTable, the choices for this row;
+    # for any other strategy, None.
+    choices = [
+        strategy.choices[n] if isinstance(strategy, StrategyTable) else None
+        for strategy in strategies
+    ]
+    strategies = [instrument.wrap("policyeval.strategy", s) for s in strategies]
+
+    table = outcome_table(sides, n)
+    instrument.count(
+        "policyeval.cells", len(table.outcomes) * (max_sum + 1) * len(strategies)
+    )
+    for rank, (outcome, multiplicity, outcome_sum, candidates) in enumerate(
+        zip(
+            table.outcomes,
+            table.multiplicities,
+            table.sums,
+            reroll_candidates(sides, n),
+        )
+    ):
+        base = rank * (max_sum + 1)
+        for strategy, c, values, tmp_value in zip(
+            strategies, choices, tables, tmp_values
+        ):
+            for s in range(0, max_sum + 1):
+                if c is not None:
+                    reroll_count, keep_sum = candidates[c[base + s]]
+                else:
+                    reroll = strategy(outcome, s)
+                    reroll_count = len(reroll)
+                    keep_sum = outcome_sum - sum(reroll)
+                tmp_value[s] += multiplicity * values[reroll_count][s + keep_sum]
+
+    with instrument.timer("policyeval.divide"):
+        return [[divide(a, sides**n) for a in t] for t in tmp_values]
+
+
+def reroll_slices(n: int) -> list[slice]:
+    """
+    What can we do with an outcome on n dice?
+    Reroll the first m (0 <= m < n) or the last m (1 <= m < n).
+
+    >>> reroll_slices(2)
+    [slice(0, 0, None), slice(0, 1, None), slice(1, 2, None)]
+    """
+    return [slice(0, m) for m in range(n)] + [slice(m, n) for m in range(1, n)]
+
+
+@functools.lru_cache(maxsize=None)
+def reroll_candidates(sides: int, n: int) -> tuple[tuple[tuple[int, int], ...], ...]:
+    """
+    For each outcome in outcome_table(sides, n), the pair
+    (reroll_count, keep_sum) of each slice in reroll_slices(n).
+
+    >>> reroll_candidates(2, 2)[1]
+    ((0, 1), (1, 1), (1, 0))
+    """
+    table = outcome_table(sides, n)
+    return tuple(
+        tuple(
+            (r.stop - r.start, outcome_sum - sum(outcome[r])) for r in reroll_slices(n)
+        )
+        for outcome, outcome_sum in zip(table.outcomes, table.sums)
+    )
+
+
+def optimal_values_single_row(
+    n: int,
+    dice_count: int,
+    sides: int,
+    values: Sequence[Sequence[Value]],
+    divide: Divide = fractions.Fraction,
+    choices: array.array | None = None,
+) -> Sequence[Value]:
+    """
+    Same as compute_values_single_row with the optimizing strategy,
+    but instead of asking the strategy once per (outcome, s), take for
+    each outcome the values of all candidate rerolls as whole rows over s
+    and let max() pick the best candidate for every s at once.
+
+    If "choices" is given, the index into reroll_slices(n) of the best
+    candidate is appended to it for every outcome and s in turn.
+    """
+    (row,) = optimal_values_single_rows(
+        n, dice_count, sides, [values], divide, [choices]
+    )
+    return row
+
+
+@instrument.timed("policyeval.optimal_values_single_rows")
+def optimal_values_single_rows(
+    n: int,
+    dice_count: int,
+    sides: int,
+    tables: Sequence[Sequence[Sequence[Value]]],
+    divide: Divide = fractions.Fraction,
+    choices: Sequence[array.array | None] | None = None,
+    lo: int = 0,
+    hi: int | None = None,
+) -> list[Sequence[Value]]:
+    """
+    optimal_values_single_row for several value tables at once,
+    going through the outcomes and their candidates only once.
+
+    Only the sums lo, ..., hi (by default all of them) are computed,
+    and the rows and choices cover just those sums.
+    """
+    assert n >= 1
+    max_sum = (dice_count - n) * (sides - 1)
+    if hi is None:
+        hi = max_sum
+    assert 0 <= lo <= hi <= max_sum
+    tmp_values: list[list[Value]] = [
+        [0 for s in range(lo, hi + 1)] for values in tables
+    ]
+    if choices is None:
+        choices = [None for values in tables]
+
+    table = outcome_table(sides, n)
+    instrument.count(
+        "policyeval.cells", len(table.outcomes) * (hi - lo + 1) * len(tables)
+    )
+    for multiplicity, candidates in zip(
+        table.multiplicities, reroll_candidates(sides, n)
+    ):
+        bounds = [(r, k + lo, k + hi + 1) for r, k in candidates]
+        for i, values in enumerate(tables):
+            # columns[j][s] is the value of choosing candidate j with sum s.
+            columns = [values[r][k:stop] for r, k, stop in bounds]
+            rows = list(zip(*columns))
+            best = list(map(max, rows))
+            c = choices[i]
+            if c is not None:
+                # tuple.index finds the first best candidate, like the strategy.
+                c.extend(map(tuple.index, rows, best))
+            tmp_values[i] = [t + multiplicity * b for t, b in zip(tmp_values[i], best)]
+
+    with instrument.timer("policyeval.divide"):
+        return [[divide(a, sides**n) for a in t] for t in tmp_values]
+
+
+class LazyValues(Sequence[Sequence[fractions.Fraction]]):
+    """
+    The values table of solve_game, where values[n][s] is only computed
+    when it is first accessed, and then remembered.
+    A cell only depends on the cells with fewer dice and at least
+    the same sum, so a query with few dice left in a large game
+    only computes a small corner of the table.
+
+    >>> v = LazyValues(30, 6, lambda s: s % 7)
+    >>> v[2][140]
+    Fraction(433, 108)
+    >>> v.computed_cells
+    7
+    >>> v[2][140] == solve_game(2, 6, lambda s: (s + 140) % 7)[0][2][0]
+    True
+    """
+
+    def __init__(self, dice_count: int, sides: int, utility: Utility) -> None:
+        self.dice_count = dice_count
+        self.sides = sides
+        self._rows: list[Sequence] = [
+            [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+        ]
+        self._rows += [LazyRow(self, n) for n in range(1, dice_count + 1)]
+
+    @property
+    def computed_cells(self) -> int:
+        return sum(len(row._cells) for row in self._rows[1:])  # type: ignore
+
+    def __len__(self) -> int:
+        return self.dice_count + 1
+
+    def __getitem__(self, n):
+        return self._rows[n]
+
+
+class LazyRow(Sequence[fractions.Fraction]):
+    def __init__(self, values: LazyValues, n: int) -> None:
+        self._values = values
+        self._n = n
+        self._cells: dict[int, fractions.Fraction] = {}
+
+    def __len__(self) -> int:
+        return (self._values.dice_count - self._n) * (self._values.sides - 1) + 1
+
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return [self[i] for i in range(*s.indices(len(self)))]
+        if s < 0:
+            s += len(self)
+        if not 0 <= s < len(self):
+            raise IndexError(s)
+        if s not in self._cells:
+            v = self._values
+            ((self._cells[s],),) = optimal_values_single_rows(
+                self._n, v.dice_count, v.sides, [v], lo=s, hi=s
+            )
+        return self._cells[s]
+
+
+def lazy_solve_game(
+    dice_count: int, sides: int, utility: Utility
+) -> tuple[LazyValues, Strategy]:
+    """
+    Same as solve_game, but nothing is computed until the values
+    or the strategy are asked for a particular number of dice and sum.
+    """
+    values = LazyValues(dice_count, sides, utility)
+    return values, optimizing_strategy(dice_count, values)
+
+
 def optimizing_strategy(
-    dice_count: int, values: Sequence[Sequence[int | fractions.Fraction]]
+    dice_count: int,
+    values: Sequence[Sequence[Value]],
+    choices: Sequence[array.array] | None = None,
 ) -> Strategy:
-    # What can we do with an outcome on n dice?
-    # Reroll the first m (0 <= m < n) or the last m (1 <= m < n).
-    rerolls = [
-        [slice(0, m) for m in range(n)] + [slice(m, n) for m in range(1, n)]
-        for n in range(dice_count + 1)
-    ]
+    """
+    If "choices" is given, every call appends the index into
+    reroll_slices(n) of its choice to choices[n] for an outcome on n dice,
+    so calling it for every outcome and sum in order fills out the
+    choices of a StrategyTable.
+    """
+    rerolls = [reroll_slices(n) for n in range(dice_count + 1)]
 
     def reroll_strategy(outcome: Sequence[int], current_sum: int) -> Sequence[int]:
         """
@@ -63,9 +436,9 @@ def optimizing_strategy(
         order. Returns the subset of the dice to reroll.
         """
         outcome_sum = sum(outcome)
-        best_reroll: slice | None
+        best_reroll: int | None
         best_reroll = best_value = None
-        for reroll_slice in rerolls[len(outcome)]:
+        for i, reroll_slice in enumerate(rerolls[len(outcome)]):
             reroll_sum = sum(outcome[reroll_slice])
             reroll_count = reroll_slice.stop - reroll_slice.start
             keep_sum = outcome_sum - reroll_sum
@@ -74,17 +447,92 @@ def optimizing_strategy(
             # and reroll the "reroll_count" dice.
             reroll_value = values[reroll_count][current_sum + keep_sum]
             if best_reroll is None or best_value < reroll_value:
-                best_reroll = reroll_slice
+                best_reroll = i
                 best_value = reroll_value
         assert best_reroll is not None
-        return outcome[best_reroll]
+        if choices is not None:
+            choices[len(outcome)].append(best_reroll)
+        return outcome[rerolls[len(outcome)][best_reroll]]
 
     return reroll_strategy
 
 
+class StrategyTable:
+    """
+    A Strategy stored as a dense table instead of a closure.
+    For an outcome on n dice and an accumulated sum s,
+    choices[n][outcome_rank(sides, outcome) * (max_sum + 1) + s]
+    is the index into reroll_slices(n) of the dice to reroll,
+    where max_sum = (dice_count - n) * (sides - 1).
+    """
+
+    def __init__(
+        self, dice_count: int, sides: int, choices: Sequence[Sequence[int]]
+    ) -> None:
+        self.dice_count = dice_count
+        self.sides = sides
+        self.choices = choices
+        self._rerolls = [reroll_slices(n) for n in range(dice_count + 1)]
+        self._widths = [
+            (dice_count - n) * (sides - 1) + 1 for n in range(dice_count + 1)
+        ]
+
+    def reroll_slice(self, outcome: Sequence[int], current_sum: int) -> slice:
+        n = len(outcome)
+        assert 0 <= current_sum < self._widths[n]
+        i = outcome_rank(self.sides, outcome) * self._widths[n] + current_sum
+        return self._rerolls[n][self.choices[n][i]]
+
+    def __call__(self, outcome: Sequence[int], current_sum: int) -> Sequence[int]:
+        """
+        "outcome" is a list of length [1, dice_count] with dice in sorted
+        order. Returns the subset of the dice to reroll.
+        """
+        return outcome[self.reroll_slice(outcome, current_sum)]
+
+
+def compile_strategy(
+    dice_count: int, sides: int, values: Sequence[Sequence[Value]]
+) -> StrategyTable:
+    """
+    Tabulate optimizing_strategy(dice_count, values).
+
+    >>> values = solve_game(3, 4, lambda s: s % 4)[0]
+    >>> f = optimizing_strategy(3, values)
+    >>> t = compile_strategy(3, 4, values)
+    >>> all(f(o, s) == t(o, s) for n in (1, 2, 3)
+    ...     for o in outcome_table(4, n).outcomes for s in range(7 - 3 * n))
+    True
+    """
+    choices = [array.array("H")]
+    for n in range(1, dice_count + 1):
+        choices.append(array.array("H"))
+        optimal_values_single_row(n, dice_count, sides, values, choices=choices[n])
+    return StrategyTable(dice_count, sides, choices)
+
+
+def row_work(dice_count: int, sides: int) -> list[int]:
+    """
+    The number of (outcome, sum) pairs to go through for each row,
+    which the time to compute the row is roughly proportional to.
+
+    >>> row_work(2, 6)
+    [0, 36, 21]
+    """
+    return [0] + [
+        len(outcome_table(sides, n).outcomes) * ((dice_count - n) * (sides - 1) + 1)
+        for n in range(1, dice_count + 1)
+    ]
+
+
 def solve_game(
-    dice_count: int, sides: int, utility: Utility
-) -> tuple[Sequence[Sequence[int | fractions.Fraction]], Strategy]:
+    dice_count: int,
+    sides: int,
+    utility: Utility,
+    backend: str = "closure",
+    numeric: str = "fraction",
+    progress: instrument.Progress | None = None,
+) -> tuple[Sequence[Sequence[Value]], Strategy]:
     """
     Suppose we have n k-sided dice (sides 0, 1, ..., k-1)
     and we perform the following process:
@@ -96,8 +544,32 @@ def solve_game(
     and you win utility(sum).
     What is the expected utility of the optimal strategy?
 
+    With backend="closure", each row is computed by asking the strategy
+    for every outcome and sum; backend="array" computes each row directly
+    using optimal_values_single_row. Both give the same values.
+    The returned strategy is a StrategyTable.
+
+    With numeric="fraction", every row is a list of Fractions.
+    With numeric="integer", the rows are kept as Python ints that are
+    common_denominator() times the actual values while solving, which
+    avoids a gcd on every addition, and only the returned table is
+    converted to Fractions. The results are exactly the same.
+    With numeric="float", the rows are floats, which are within
+    float_error_bounds of the exact values; verify_strategy checks
+    exactly whether the strategy chosen with floats is optimal.
+
+    "progress" is called after each row with the number of cells
+    computed so far and in total, weighted by the number of outcomes.
+
     >>> print(value(1, 6, lambda s: s))  # Expected throw
     5/2
+    >>> a = solve_game(4, 6, lambda s: s % 5)[0]
+    >>> b = solve_game(4, 6, lambda s: s % 5, backend="array")[0]
+    >>> a == b
+    True
+    >>> u = lambda s: fractions.Fraction(s % 5, 3)
+    >>> solve_game(4, 6, u)[0] == solve_game(4, 6, u, numeric="integer")[0]
+    True
 
     Probability of getting an even number:
     >>> print(value(1, 6, lambda s: 1 if s % 2 == 0 else 0))
@@ -106,34 +578,460 @@ def solve_game(
 
     # values[n][s] == v means that for n remaining dice,
     # accumulated sum s, the expected utility is v.
-    values: list[Sequence[int | fractions.Fraction]] = []
-
     # Fill out "values" for n = 0 using the utility function.
-    values.append([utility(s) for s in range(dice_count * (sides - 1) + 1)])
+    utility_row = [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+    values, divide, scale = initial_values(dice_count, sides, utility_row, numeric)
 
-    reroll_strategy = optimizing_strategy(dice_count, values)
+    choices = [array.array("H") for n in range(dice_count + 1)]
+    # The closure backend records its choices while solving.
+    reroll_strategy = optimizing_strategy(dice_count, values, choices)
+    work = row_work(dice_count, sides)
 
     for n in range(1, dice_count + 1):
-        values.append(
-            compute_values_single_row(n, dice_count, sides, reroll_strategy, values)
+        if backend == "closure":
+            row = compute_values_single_row(
+                n, dice_count, sides, reroll_strategy, values, divide
+            )
+        elif backend == "array":
+            row = optimal_values_single_row(
+                n, dice_count, sides, values, divide, choices[n]
+            )
+        else:
+            raise ValueError("Unknown backend %r" % (backend,))
+        values.append(row)
+        if progress is not None:
+            progress(sum(work[: n + 1]), sum(work))
+
+    strategy = StrategyTable(dice_count, sides, choices)
+
+    if numeric == "integer":
+        values = unscale_table(utility_row, scale, values)
+
+    return values, strategy
+
+
+def float_error_bounds(
+    dice_count: int, sides: int, utility_row: Sequence[Value]
+) -> list[float]:
+    """
+    For each n, a bound on how far values[n][s] from solve_game with
+    numeric="float" can be from the exact value, for any s.
+
+    Each value in row n is a sum of one term per outcome, multiplicity
+    times the best of some values from earlier rows, divided by sides**n.
+    Picking the best does not add any error, and with K outcomes, the
+    rounding in the products, the sum and the division is at most
+    gamma(K + 2) = (K + 2) * u / (1 - (K + 2) * u) relative to the sum of
+    the absolute values of the terms, where u = 2**-53. The multiplicities
+    sum to sides**n, so the error is at most the error in the earlier rows
+    plus gamma(K + 2) times the largest absolute value.
+
+    >>> u = lambda s: s % 5
+    >>> bounds = float_error_bounds(6, 6, [u(s) for s in range(31)])
+    >>> bounds[0], bounds[6] < 1e-12
+    (0.0, True)
+    >>> exact = solve_game(6, 6, u, "array", "integer")[0]
+    >>> approx = solve_game(6, 6, u, "array", "float")[0]
+    >>> all(abs(a - e) <= b for x, y, b in zip(approx, exact, bounds)
+    ...     for a, e in zip(x, y))
+    True
+    """
+    unit = 2.0**-53
+    error = max(
+        abs(fractions.Fraction(float(u)) - fractions.Fraction(u)) for u in utility_row
+    )
+    largest = max(abs(fractions.Fraction(u)) for u in utility_row)
+    bounds = [float(error)]
+    for n in range(1, dice_count + 1):
+        k = len(outcome_table(sides, n).outcomes) + 2
+        gamma = k * unit / (1 - k * unit)
+        bounds.append(bounds[-1] + gamma * (float(largest) + bounds[-1]))
+    return bounds
+
+
+def verify_strategy(
+    dice_count: int, sides: int, utility: Utility, strategy: StrategyTable
+) -> tuple[Sequence[Sequence[Value]], bool]:
+    """
+    Compute the exact values of "strategy", as compute_values does with
+    numeric="integer", and check that no other choice in any state is
+    strictly better, which means that the strategy is optimal and the
+    values are those of solve_game.
+
+    >>> u = lambda s: s % 5
+    >>> values, strategy = solve_game(5, 6, u, "array", "float")
+    >>> exact, optimal = verify_strategy(5, 6, u, strategy)
+    >>> optimal, exact == solve_game(5, 6, u)[0]
+    (True, True)
+    >>> greedy = StrategyTable(2, 6, [[], [0] * 36, [0] * 21])
+    >>> verify_strategy(2, 6, u, greedy)[1]
+    False
+    """
+    utility_row = [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+    values, divide, scale = initial_values(dice_count, sides, utility_row, "integer")
+    optimal = True
+    for n in range(1, dice_count + 1):
+        (row,) = compute_values_single_rows(
+            n, dice_count, sides, [strategy], [values], divide
+        )
+        (best,) = optimal_values_single_rows(n, dice_count, sides, [values], divide)
+        optimal = optimal and row == best
+        values.append(row)
+    return unscale_table(utility_row, scale, values), optimal
+
+
+def final_sum_distribution(
+    dice_count: int,
+    sides: int,
+    strategy: Strategy,
+    roll_z: Sequence[int] | None = None,
+    current_sum: int = 0,
+    numeric: str = "fraction",
+) -> list[fractions.Fraction] | list[float]:
+    """
+    The probability of each final sum 0, ..., dice_count*(sides-1) when
+    playing "strategy" after throwing the sorted "roll_z" with
+    accumulated sum "current_sum", or before the first throw if "roll_z"
+    is None. The expected value of any utility under the strategy is then
+    a sum over the final sums, without solving another game.
+
+    The probabilities are pushed forward one row at a time, from the most
+    remaining dice to none, as Python ints that are sides**(1 + ... + n)
+    times the probabilities for the starting row n, and only divided
+    at the end. With numeric="float" the result is the correctly rounded
+    floats of the exact probabilities.
+
+    >>> u = lambda s: s % 5
+    >>> values, strategy = solve_game(4, 6, u, "array")
+    >>> p = final_sum_distribution(4, 6, strategy)
+    >>> sum(p), sum(q * u(s) for s, q in enumerate(p)) == values[4][0]
+    (Fraction(1, 1), True)
+    >>> p = final_sum_distribution(4, 6, strategy, (0, 2, 4), 3)
+    >>> sum(q * u(s) for s, q in enumerate(p)) == roll_value_function(
+    ...     values, strategy)((0, 2, 4), 3)
+    True
+    >>> p = final_sum_distribution(4, 6, strategy)
+    >>> print(sum(p[:5]), final_sum_distribution(4, 6, strategy, numeric="float")[0])
+    57649/1119744 2.48072575318803e-07
+    """
+    if numeric not in ("fraction", "float"):
+        raise ValueError("Unknown numeric mode %r" % (numeric,))
+    widths = [(dice_count - n) * (sides - 1) + 1 for n in range(dice_count + 1)]
+    mass: list[list[int]] = [[0] * w for w in widths]
+    if roll_z is None:
+        top = dice_count
+        mass[top][current_sum] = 1
+    else:
+        reroll = strategy(roll_z, current_sum)
+        top = len(reroll)
+        mass[top][current_sum + sum(roll_z) - sum(reroll)] = 1
+    # exponents[n] is 1 + ... + n, so mass[n] is sides**(exponents[top] -
+    # exponents[n]) times the probabilities of the states with n dice left.
+    exponents = [n * (n + 1) // 2 for n in range(dice_count + 1)]
+    for n in range(top, 0, -1):
+        row = mass[n]
+        sums = [s for s, m in enumerate(row) if m]
+        if not sums:
+            continue
+        table = outcome_table(sides, n)
+        choices = strategy.choices[n] if isinstance(strategy, StrategyTable) else None
+        for rank, (outcome, multiplicity, outcome_sum, candidates) in enumerate(
+            zip(
+                table.outcomes,
+                table.multiplicities,
+                table.sums,
+                reroll_candidates(sides, n),
+            )
+        ):
+            base = rank * widths[n]
+            for s in sums:
+                if choices is not None:
+                    reroll_count, keep_sum = candidates[choices[base + s]]
+                else:
+                    reroll = strategy(outcome, s)
+                    reroll_count = len(reroll)
+                    keep_sum = outcome_sum - sum(reroll)
+                mass[reroll_count][s + keep_sum] += (
+                    multiplicity
+                    * row[s]
+                    * sides ** (exponents[n - 1] - exponents[reroll_count])
+                )
+    scale = sides ** exponents[top]
+    if numeric == "float":
+        return [m / scale for m in mass[0]]
+    return [fractions.Fraction(m, scale) for m in mass[0]]
+
+
+def solve_games(
+    dice_count: int,
+    sides: int,
+    utilities: Sequence[Utility],
+    numeric: str = "fraction",
+    progress: instrument.Progress | None = None,
+) -> list[tuple[Sequence[Sequence[Value]], StrategyTable]]:
+    """
+    Same as [solve_game(dice_count, sides, u, "array", numeric)
+    for u in utilities], but all the games are solved in the same pass
+    over the outcomes and states.
+
+    >>> utilities = [lambda s: s, lambda s: s % 3 == 0]
+    >>> [v for v, s in solve_games(3, 4, utilities)] == [
+    ...     solve_game(3, 4, u)[0] for u in utilities]
+    True
+    """
+    if not utilities:
+        return []
+    utility_rows = []
+    tables = []
+    scales = []
+    for utility in utilities:
+        utility_rows.append([utility(s) for s in range(dice_count * (sides - 1) + 1)])
+        values, divide, scale = initial_values(
+            dice_count, sides, utility_rows[-1], numeric
         )
+        tables.append(values)
+        scales.append(scale)
+    choices: list[list[array.array]] = [[array.array("H")] for values in tables]
+    work = row_work(dice_count, sides)
+
+    for n in range(1, dice_count + 1):
+        for c in choices:
+            c.append(array.array("H"))
+        rows = optimal_values_single_rows(
+            n, dice_count, sides, tables, divide, [c[n] for c in choices]
+        )
+        for values, row in zip(tables, rows):
+            values.append(row)
+        if progress is not None:
+            progress(sum(work[: n + 1]), sum(work))
+
+    results: list[tuple[Sequence[Sequence[Value]], StrategyTable]] = []
+    for utility_row, values, scale, c in zip(utility_rows, tables, scales, choices):
+        if numeric == "integer":
+            values = unscale_table(utility_row, scale, values)
+        results.append((values, StrategyTable(dice_count, sides, c)))
+    return results
+
+
+def affected_sums(
+    dice_count: int,
+    sides: int,
+    old_utility_row: Sequence[Value],
+    new_utility_row: Sequence[Value],
+) -> list[tuple[int, int] | None]:
+    """
+    For each n, the range (lo, hi) of sums s where values[n][s] and
+    the choices for outcomes on n dice at s may differ between the two
+    utility rows, or None if none of them can.
+    With n dice left at sum s the final sum is in s, ..., s + n*(sides-1),
+    so only those s that can reach a changed utility are affected.
+
+    >>> affected_sums(3, 4, [0] * 7, [0, 0, 0, 0, 1, 0, 0])
+    [(4, 4), (1, 4), (0, 3), (0, 0)]
+    >>> affected_sums(2, 4, [0] * 5, [0] * 5)
+    [None, None, None]
+    """
+    changed = [
+        s for s, (a, b) in enumerate(zip(old_utility_row, new_utility_row)) if a != b
+    ]
+    if not changed:
+        return [None] * (dice_count + 1)
+    return [
+        (
+            max(0, changed[0] - n * (sides - 1)),
+            min((dice_count - n) * (sides - 1), changed[-1]),
+        )
+        for n in range(dice_count + 1)
+    ]
 
-    return values, reroll_strategy
+
+def resolve_game(
+    dice_count: int,
+    sides: int,
+    solution: tuple[Sequence[Sequence[Value]], StrategyTable],
+    utility: Utility,
+) -> tuple[Sequence[Sequence[Value]], StrategyTable]:
+    """
+    Same as solve_game(dice_count, sides, utility, "array"), given the
+    "solution" of the game for another utility function. Only the values
+    and choices in the ranges given by affected_sums are recomputed,
+    so a change to the utility of a few high sums is cheap to re-solve.
+    The values are computed exactly, so the solution must be exact too,
+    as from numeric="fraction" or "integer"; a solution with floats
+    raises ValueError.
+
+    >>> u = lambda s: s % 5
+    >>> solution = solve_game(4, 6, u)
+    >>> v = lambda s: 3 if s == 17 else s % 5
+    >>> values, strategy = resolve_game(4, 6, solution, v)
+    >>> expected_values, expected = solve_game(4, 6, v)
+    >>> values == expected_values
+    True
+    >>> [list(c) for c in strategy.choices] == [list(c) for c in expected.choices]
+    True
+    >>> resolve_game(4, 6, solve_game(4, 6, u, numeric="float"), v)
+    Traceback (most recent call last):
+      ...
+    ValueError: resolve_game needs an exact solution, not floats
+    """
+    old_values, old_strategy = solution
+    if any(isinstance(v, float) for row in old_values for v in row):
+        raise ValueError("resolve_game needs an exact solution, not floats")
+    utility_row = [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+    windows = affected_sums(dice_count, sides, old_values[0], utility_row)
+    # Both the old and the new values are exact multiples of 1 / scale.
+    scale = math.lcm(
+        common_denominator(dice_count, sides, old_values[0]),
+        common_denominator(dice_count, sides, utility_row),
+    )
+    # Row n's window reads sums lo, ..., hi + (n - r)*(sides-1) of row r < n,
+    # so only those are scaled; the other cells are never read.
+    widths = [(dice_count - n) * (sides - 1) + 1 for n in range(dice_count + 1)]
+    needed: list[tuple[int, int] | None] = [None] * (dice_count + 1)
+    for n, window in enumerate(windows):
+        if window is None:
+            continue
+        lo, hi = window
+        for r in range(n + 1):
+            a, b = lo, min(hi + (n - r) * (sides - 1), widths[r] - 1)
+            previous = needed[r]
+            if previous is not None:
+                a, b = min(a, previous[0]), max(b, previous[1])
+            needed[r] = a, b
+    scaled: list[list[int]] = []
+    for n in range(dice_count + 1):
+        row = [0] * widths[n]
+        cells = needed[n]
+        if cells is not None:
+            a, b = cells
+            old_row = utility_row if n == 0 else old_values[n]
+            row[a : b + 1] = [int(v * scale) for v in old_row[a : b + 1]]
+        scaled.append(row)
+
+    result_values: list[Sequence[Value]] = [utility_row]
+    choices: list[Sequence[int]] = [old_strategy.choices[0]]
+    for n in range(1, dice_count + 1):
+        window = windows[n]
+        if window is None:
+            result_values.append(old_values[n])
+            choices.append(old_strategy.choices[n])
+            continue
+        lo, hi = window
+        window_choices = array.array("H")
+        (new_row,) = optimal_values_single_rows(
+            n, dice_count, sides, [scaled], exact_divide, [window_choices], lo, hi
+        )
+        scaled[n][lo : hi + 1] = map(int, new_row)
+        result_row = list(old_values[n])
+        result_row[lo : hi + 1] = unscale_values(scale, [scaled[n][lo : hi + 1]])[0]
+        result_values.append(result_row)
+        c = array.array("H", old_strategy.choices[n])
+        w = hi - lo + 1
+        for rank in range(len(c) // widths[n]):
+            c[rank * widths[n] + lo : rank * widths[n] + hi + 1] = window_choices[
+                rank * w : (rank + 1) * w
+            ]
+        choices.append(c)
+    return result_values, StrategyTable(dice_count, sides, choices)
+
+
+def cached_solve_game(
+    dice_count: int, sides: int, utility: Utility
+) -> tuple[Sequence[Sequence[Value]], Strategy]:
+    """
+    Same as solve_game, but the result is stored in the on-disk cache
+    and loaded from there if the same game has been solved before.
+    """
+    return cached_solve_games(dice_count, sides, [utility])[0]
+
+
+def cached_solve_games(
+    dice_count: int, sides: int, utilities: Sequence[Utility]
+) -> list[tuple[Sequence[Sequence[Value]], Strategy]]:
+    """
+    Same as solve_games, but results are stored in the on-disk cache
+    and loaded from there if the same game has been solved before.
+    The games that are not in the cache are solved together.
+
+    >>> import os, tempfile, unittest.mock
+    >>> utilities = [lambda s: s % 5, lambda s: fractions.Fraction(s, 7)]
+    >>> with tempfile.TemporaryDirectory() as d:
+    ...     with unittest.mock.patch.dict(os.environ, THIRTYGAME_CACHE=d):
+    ...         solved = cached_solve_games(4, 6, utilities)
+    ...         loaded = cached_solve_games(4, 6, utilities)
+    ...         files = len(os.listdir(d))
+    >>> files, [type(values[1]).__name__ for values, strategy in loaded]
+    (2, ['PackedFractions', 'PackedFractions'])
+    >>> for u, (values, strategy) in zip(utilities, loaded):
+    ...     expected_values, expected = solve_game(4, 6, u)
+    ...     print([list(row) for row in values] == expected_values,
+    ...           [list(c) for c in strategy.choices]
+    ...           == [list(c) for c in expected.choices])
+    True True
+    True True
+    """
+    results: list = []
+    missing = []
+    for utility in utilities:
+        utility_row = [utility(s) for s in range(dice_count * (sides - 1) + 1)]
+        path = cache.cache_path(
+            "policyeval", SOLVER_VERSION, dice_count, sides, utility_row
+        )
+        results.append(load_cached_game(path, dice_count, sides, utility_row))
+        if results[-1] is None:
+            missing.append((len(results) - 1, path, utility_row))
+
+    solved = solve_games(
+        dice_count, sides, [u.__getitem__ for i, p, u in missing], "integer"
+    )
+    for (i, path, utility_row), (values, strategy) in zip(missing, solved):
+        offsets, data = cache.pack_fractions(v for row in values for v in row)
+        choices = b"".join(array.array("H", c).tobytes() for c in strategy.choices)
+        cache.write_tables(
+            path,
+            {"dice_count": dice_count, "sides": sides},
+            {"offsets": offsets.tobytes(), "data": data, "choices": choices},
+        )
+        results[i] = values, strategy
+    return results
+
+
+def load_cached_game(
+    path: str,
+    dice_count: int,
+    sides: int,
+    utility_row: Sequence[Value],
+) -> tuple[Sequence[Sequence[Value]], StrategyTable] | None:
+    tables = cache.read_tables(path)
+    if tables is None:
+        return None
+    meta, sections = tables
+    cells = cache.PackedFractions(sections["offsets"], sections["data"])
+    packed_choices = sections["choices"].cast("H")
+    values = []
+    choices = []
+    i = j = 0
+    for n in range(dice_count + 1):
+        width = (dice_count - n) * (sides - 1) + 1
+        values.append(cells[i : i + width] if n else utility_row)
+        i += width
+        choices_count = len(outcome_table(sides, n).outcomes) * width if n else 0
+        choices.append(packed_choices[j : j + choices_count])
+        j += choices_count
+    return values, StrategyTable(dice_count, sides, choices)
 
 
-def value(dice_count: int, sides: int, utility: Utility) -> int | fractions.Fraction:
+def value(dice_count: int, sides: int, utility: Utility) -> Value:
     # Only used in doctest
     return solve_game(dice_count, sides, utility)[0][dice_count][0]
 
 
 def roll_value_function(
-    values: Sequence[Sequence[int | fractions.Fraction]], strategy: Strategy
+    values: Sequence[Sequence[Value]], strategy: Strategy
 ) -> RollValueFunction:
-    def roll_value(
-        roll_z: Sequence[int], current_sum: int = 0
-    ) -> int | fractions.Fraction:
+    def roll_value(roll_z: Sequence[int], current_sum: int = 0) -> Value:
         roll_sum = sum(roll_z)
-        reroll = strategy(roll_z, 0)
+        reroll = strategy(roll_z, current_sum)
         reroll_sum = sum(reroll)
         keep_sum = roll_sum - reroll_sum
         return values[len(reroll)][current_sum + keep_sum]
@@ -2,8 +2,10 @@ import collections
 import functools
 import itertools
 import operator
-from math import factorial
-from typing import Iterable, Iterator, Sequence
+from math import comb, factorial
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
+import instrument
 
 
 def product(iterable: Iterable[int]) -> int:
@@ -22,17 +24,68 @@ def permutations(s: Iterable[int]) -> int:
     return factorial(n) // product(map(factorial, counts.values()))
 
 
-def outcomes(sides: int, dice_count: int) -> Iterator[tuple[Sequence[int], int]]:
-    outcomes_ = itertools.combinations_with_replacement(range(sides), dice_count)
-    n_outcomes = 0
-    n_distinct = 0
-    for outcome in outcomes_:
-        multiplicity = permutations(outcome)
-        n_outcomes += multiplicity
-        n_distinct += 1
-        yield outcome, multiplicity
-    assert n_outcomes == sides**dice_count
-    assert n_distinct == (
+class OutcomeTable(NamedTuple):
+    """
+    All distinct outcomes of throwing dice_count dice with sides sides,
+    each outcome sorted, in the order of combinations_with_replacement,
+    together with the number of ordered throws giving each outcome and
+    the sum of each outcome.
+    """
+
+    sides: int
+    dice_count: int
+    outcomes: tuple[tuple[int, ...], ...]
+    multiplicities: tuple[int, ...]
+    sums: tuple[int, ...]
+
+
+@functools.lru_cache(maxsize=None)
+@instrument.timed("rolls.outcome_table")
+def outcome_table(sides: int, dice_count: int) -> OutcomeTable:
+    """
+    >>> t = outcome_table(6, 2)
+    >>> len(t.outcomes), sum(t.multiplicities)
+    (21, 36)
+    >>> t.outcomes[1], t.multiplicities[1], t.sums[1]
+    ((0, 1), 2, 1)
+    >>> outcome_table(6, 2) is t
+    True
+    """
+    outcomes_ = tuple(itertools.combinations_with_replacement(range(sides), dice_count))
+    multiplicities = tuple(map(permutations, outcomes_))
+    assert sum(multiplicities) == sides**dice_count
+    assert len(outcomes_) == (
         factorial(dice_count + sides - 1)
         // (factorial(dice_count) * factorial(sides - 1))
     )
+    return OutcomeTable(
+        sides, dice_count, outcomes_, multiplicities, tuple(map(sum, outcomes_))
+    )
+
+
+def outcomes(sides: int, dice_count: int) -> Iterator[tuple[Sequence[int], int]]:
+    instrument.count("rolls.outcomes")
+    table = outcome_table(sides, dice_count)
+    return zip(table.outcomes, table.multiplicities)
+
+
+def outcome_rank(sides: int, outcome: Sequence[int]) -> int:
+    """
+    Index of the sorted "outcome" in outcome_table(sides, len(outcome)).
+
+    Before the outcome come all outcomes that agree with it on the first
+    i dice and have a smaller (i+1)th die v; there are comb(sides-v+m-1, m)
+    of those for each v, where m is the number of dice after the (i+1)th.
+
+    >>> t = outcome_table(4, 3)
+    >>> all(outcome_rank(4, o) == i for i, o in enumerate(t.outcomes))
+    True
+    """
+    rank = 0
+    prev = 0
+    m = len(outcome)
+    for v in outcome:
+        m -= 1
+        rank += comb(sides - prev + m, m + 1) - comb(sides - v + m, m + 1)
+        prev = v
+    return rank
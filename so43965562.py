@@ -65,8 +65,154 @@ You can run the solution as follows:
     n = 133
     so43965562(list1=[[0]*n], list2=[[0]*n], lists_out=lists_out)
     print(len(lists_out[0]))
-    # Outputs 1795769, takes about 2.5 seconds to run.
+    # Outputs 189274, takes about 1.5 seconds to run.
 
 Note that the output size increases exponentially, starting at
 nothing when n = 7*16 = 112, so it will still take a long time to compute
 all the combinations when n = 198 as you write in your question.
+
+If you only need to know how many combinations there are, or want to
+pick out a particular one, you don't have to go through them at all.
+The number of ways to write `s` as a sum of `n` integers in `[l, u]`
+follows the same recursion as `combinations_summing_to`, and with
+`functools.lru_cache` it only has about `n * s * (u - l)` cases to
+consider, however many combinations there are:
+
+    import functools
+    @functools.lru_cache(maxsize=None)
+    def count_combinations_summing_to(l, u, n, s):
+        """How many ways can s be written as the sum of n integers in [l, u]?
+
+        >>> count_combinations_summing_to(0, 5, 3, 5)
+        5
+        >>> count_combinations_summing_to(16, 36, 8, 198)
+        54799
+        """
+        if n == 0:
+            return 1 if s == 0 else 0
+        elif n == 1:
+            return 1 if l <= s <= u else 0
+        else:
+            return sum(
+                count_combinations_summing_to(l, k, n - 1, s - k)
+                for k in range(u, l-1, -1)
+                if l * n <= s <= k * n)
+
+The counts tell us how many combinations come before the ones that end
+in a given `k`, so we can go straight to the combination at a given
+index in the order of `combinations_summing_to`, and back:
+
+    def nth_combination_summing_to(l, u, n, s, index):
+        """The combination at position index in combinations_summing_to.
+
+        >>> nth_combination_summing_to(0, 5, 3, 5, 3)
+        (1, 1, 3)
+        """
+        if not 0 <= index < count_combinations_summing_to(l, u, n, s):
+            raise IndexError(index)
+        suffix = ()
+        while n > 1:
+            for k in range(u, l-1, -1):
+                if not l * n <= s <= k * n:
+                    continue
+                c = count_combinations_summing_to(l, k, n - 1, s - k)
+                if index < c:
+                    break
+                index -= c
+            suffix = (k,) + suffix
+            u, n, s = k, n - 1, s - k
+        return (s,) + suffix if n == 1 else suffix
+
+    def rank_combination_summing_to(l, u, combination):
+        """The position of combination in combinations_summing_to.
+
+        >>> rank_combination_summing_to(0, 5, (1, 1, 3))
+        3
+        """
+        n, s = len(combination), sum(combination)
+        rank = 0
+        for k in reversed(combination[1:]):
+            # Skip the combinations that end in something bigger than k
+            for j in range(u, k, -1):
+                if l * n <= s <= j * n:
+                    rank += count_combinations_summing_to(l, j, n - 1, s - j)
+            u, n, s = k, n - 1, s - k
+        return rank
+
+For example, `so43965562` with `n = 198` would give this many results,
+and we can look at a few of them picked at random:
+
+    import random
+    n = 198
+    counts = [count_combinations_summing_to(16, 36, k, n) for k in (7, 8)]
+    print(sum(c * c for c in counts))
+    # Outputs 3181233010.
+    for k, c in zip((7, 8), counts):
+        for index in random.sample(range(c), 2):
+            t = nth_combination_summing_to(16, 36, k, n, index)
+            assert rank_combination_summing_to(16, 36, t) == index
+            print(index, t)
+
+The same functions let you split up the work of `so43965562` itself.
+Each result pairs a combination summing to `len(list1[i])` with one
+summing to `len(list2[i])`, so we can give each process a range of
+indices of the first combination, and have it write every pair for
+those to a file. Since all the integers are between 16 and 36, each
+result fits in `2 * n` bytes, one byte per integer, with the pairs
+interleaved as in `lists_out`. That way the results take a tiny fraction
+of the memory of the lists of tuples, and each process only keeps the
+combinations for the second length in memory, however many results it
+writes:
+
+    import concurrent.futures
+    import os
+    def write_shard(path, lower, upper, n, s1, s2, start, stop):
+        """Write the results for the combinations of n integers summing to s1
+        with index in [start, stop) to path, and return the number of results.
+        """
+        combs2 = bytes(itertools.chain.from_iterable(
+            combinations_summing_to(lower, upper, n, s2)))
+        count2 = len(combs2) // n
+        # A block of results with the same first combination,
+        # interleaved as (v1, v2), (v1, v2), ...
+        block = bytearray(2 * n * count2)
+        block[1::2] = combs2
+        with open(path, 'wb') as fp:
+            for index in range(start, stop):
+                t1 = nth_combination_summing_to(lower, upper, n, s1, index)
+                block[0::2] = bytes(t1) * count2
+                fp.write(block)
+        return (stop - start) * count2
+
+    def so43965562_shards(s1, s2, directory, lower=16, upper=36, processes=None):
+        """Write the results for lengths s1 and s2 to files in directory.
+        Returns a list of (path, n, count) where each result in path
+        is 2 * n bytes, in the same order as so43965562.
+        """
+        processes = processes or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = []
+            for n in (7, 8):
+                c1 = count_combinations_summing_to(lower, upper, n, s1)
+                for k in range(processes):
+                    start, stop = c1 * k // processes, c1 * (k + 1) // processes
+                    if start == stop:
+                        continue
+                    path = os.path.join(directory, 'shard-%d-%d.bin' % (n, k))
+                    futures.append((path, n, executor.submit(
+                        write_shard, path, lower, upper, n, s1, s2, start, stop)))
+            return [(path, n, f.result()) for path, n, f in futures]
+
+To read the results back, map a file into memory and cut it into records:
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        shards = so43965562_shards(133, 133, directory)
+        print(sum(count for path, n, count in shards))
+        # Outputs 189274, the same as so43965562 above.
+        path, n, count = shards[0]
+        with open(path, 'rb') as fp:
+            data = memoryview(fp.read())
+        record = data[:2 * n]
+        print(list(zip(record[0::2], record[1::2])))
+        # Outputs [(16, 16), (16, 16), (16, 16), (16, 16), (16, 16), (17, 17), (36, 36)]
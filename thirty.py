@@ -1,14 +1,26 @@
 import argparse
+import asyncio
+import collections
+import functools
 import itertools
-from typing import Callable
+import json
+import sys
+import time
+from typing import Any, Callable, Iterable, NamedTuple, Sequence, cast
 
 from descriptions import describe_keep_reroll
 from policyeval import (
     RollValueFunction,
+    Strategy,
     Utility,
+    cached_solve_game,
+    cached_solve_games,
+    final_sum_distribution,
     roll_value_function,
     solve_game,
+    solve_games,
 )
+from rolls import outcome_table
 
 
 def my_utility(s: int) -> int:
@@ -33,9 +45,12 @@ def my_utility(s: int) -> int:
 
 
 def roll_value_optimal(
-    dice_count: int, sides: int, utility: Utility
+    dice_count: int, sides: int, utility: Utility, use_cache: bool = False
 ) -> RollValueFunction:
-    values, strategy = solve_game(dice_count, sides, utility)
+    if use_cache:
+        values, strategy = cached_solve_game(dice_count, sides, utility)
+    else:
+        values, strategy = solve_game(dice_count, sides, utility)
     return roll_value_function(values, strategy)
 
 
@@ -56,21 +71,317 @@ def input_roll(
         except ValueError:
             print("Hmm, try again.")
             continue
-        if len(roll) > dice_count:
-            print("You can only roll %s dice at a time!" % dice_count)
-            continue
-        if not all(1 <= v <= sides for v in roll):
-            print("Those are not the %s-sided dice I know!" % sides)
-            continue
-        if len(roll) <= 1:
-            print("Looks like you're done!")
+        error = roll_error(dice_count, sides, roll)
+        if error is not None:
+            print(error)
             continue
         return roll
 
 
+def roll_error(dice_count: int, sides: int, roll: Sequence[int]) -> str | None:
+    if len(roll) > dice_count:
+        return "You can only roll %s dice at a time!" % dice_count
+    if not all(1 <= v <= sides for v in roll):
+        return "Those are not the %s-sided dice I know!" % sides
+    if len(roll) <= 1:
+        return "Looks like you're done!"
+    return None
+
+
+def describe_roll(
+    dice_count: int, sides: int, strategy: Strategy, roll: Sequence[int]
+) -> list[tuple[int, int, str]]:
+    """
+    Returns (i, j, description) for ranges [i, j] of accumulated sums
+    where the strategy does the same with the sorted "roll".
+    """
+    min_sum = dice_count - len(roll)
+    max_sum = (dice_count - len(roll)) * sides
+    rerolls = [
+        describe_keep_reroll(dice_count, sides, strategy, roll, s)
+        for s in range(min_sum, max_sum + 1)
+    ]
+    result = []
+    i = min_sum
+    for reroll, ss in itertools.groupby(rerolls):
+        j = i + len(list(ss))
+        result.append((i, j - 1, reroll))
+        i = j
+    return result
+
+
+class Answer(NamedTuple):
+    action: str
+    value: float
+    below: float
+    above: float
+
+
+class Advisor:
+    """
+    Answers queries about rolls from solved games. A query is a dict
+    with a "roll" (a list of dice in 1..sides) and optionally the
+    accumulated "sum" so far; the answer gives the advice for each range
+    of accumulated sums and, for a full roll or a given sum, the
+    chances of winning by going under or over, and the distribution
+    of the final sum when following the advice.
+    """
+
+    def __init__(
+        self,
+        dice_count: int,
+        sides: int,
+        solutions: Sequence[tuple[Sequence[Sequence[Any]], Strategy]],
+    ) -> None:
+        self.dice_count = dice_count
+        self.sides = sides
+        (self.values, self.strategy), below_solution, above_solution = solutions
+        self.below_max_prob = roll_value_function(*below_solution)
+        self.above_max_prob = roll_value_function(*above_solution)
+        self._advice: dict[tuple[int, ...], list[tuple[int, int, str]]] = {}
+        self._final_sums: dict[tuple[tuple[int, ...], int], tuple[float, ...]] = {}
+
+    def advise(self, roll: Sequence[int], current_sum: int | None = None) -> dict:
+        roll = sorted(roll)
+        error = roll_error(self.dice_count, self.sides, roll)
+        if error is not None:
+            raise ValueError(error)
+        key = tuple(roll)
+        if key not in self._advice:
+            self._advice[key] = describe_roll(
+                self.dice_count, self.sides, self.strategy, roll
+            )
+        advice = self._advice[key]
+        min_sum = self.dice_count - len(roll)
+        if current_sum is None and len(roll) == self.dice_count:
+            current_sum = 0
+        result: dict[str, Any] = {"roll": roll}
+        if current_sum is None:
+            result["advice"] = [
+                {"from": i, "to": j, "action": action} for i, j, action in advice
+            ]
+            return result
+        if not any(i <= current_sum <= j for i, j, action in advice):
+            raise ValueError("Impossible sum %s" % current_sum)
+        (action,) = [a for i, j, a in advice if i <= current_sum <= j]
+        result["sum"] = current_sum
+        result["advice"] = [{"from": current_sum, "to": current_sum, "action": action}]
+        roll_z = [v - 1 for v in roll]
+        s_z = current_sum - min_sum
+        result["below"] = float(self.below_max_prob(roll_z, s_z))
+        result["above"] = float(self.above_max_prob(roll_z, s_z))
+        result["distribution"] = self.final_sums(roll, current_sum)
+        return result
+
+    def final_sums(self, roll: Sequence[int], current_sum: int) -> tuple[float, ...]:
+        """
+        The probability of each final sum dice_count, ..., dice_count*sides
+        when following the advice after throwing the sorted "roll" with
+        accumulated sum "current_sum". Unlike "below" and "above", which
+        are the best chances that any strategy could get, these are the
+        chances under the advised strategy, so any number of thresholds can
+        be read from them without solving another game.
+        """
+        key = tuple(sorted(roll)), current_sum
+        if key not in self._final_sums:
+            min_sum = self.dice_count - len(roll)
+            distribution = final_sum_distribution(
+                self.dice_count,
+                self.sides,
+                self.strategy,
+                [v - 1 for v in key[0]],
+                current_sum - min_sum,
+                "float",
+            )
+            self._final_sums[key] = tuple(cast(list[float], distribution))
+        return self._final_sums[key]
+
+    @functools.cached_property
+    def answers(self) -> dict[tuple[tuple[int, ...], int], Answer]:
+        """
+        The Answer for every sorted roll of at least two dice and every
+        possible accumulated sum, keyed by (roll, sum).
+        """
+        value = roll_value_function(self.values, self.strategy)
+        result = {}
+        for n in range(2, self.dice_count + 1):
+            min_sum = self.dice_count - n
+            for roll_z in outcome_table(self.sides, n).outcomes:
+                roll = tuple(v + 1 for v in roll_z)
+                for s_z in range((self.dice_count - n) * (self.sides - 1) + 1):
+                    s = s_z + min_sum
+                    result[roll, s] = Answer(
+                        describe_keep_reroll(
+                            self.dice_count, self.sides, self.strategy, roll, s
+                        ),
+                        float(value(roll_z, s_z)),
+                        float(self.below_max_prob(roll_z, s_z)),
+                        float(self.above_max_prob(roll_z, s_z)),
+                    )
+        return result
+
+    def answer_batch(
+        self, queries: Iterable[tuple[Sequence[int], int]]
+    ) -> list[Answer]:
+        """
+        Answer many (roll, sum) queries at once by looking them up in
+        the precomputed table. Raises ValueError on the first invalid
+        query.
+        """
+        answers = self.answers
+        result = []
+        for roll, s in queries:
+            answer = answers.get((tuple(sorted(roll)), s))
+            if answer is None:
+                raise ValueError(
+                    roll_error(self.dice_count, self.sides, roll)
+                    or "Impossible sum %s" % s
+                )
+            result.append(answer)
+        return result
+
+
+def parse_query(line: str) -> tuple[list[int], int]:
+    """
+    Parse a line of a batch file: the roll, either as separate dice or
+    as a string of digits, followed by the accumulated sum.
+
+    >>> parse_query("1 2 3 8")
+    ([1, 2, 3], 8)
+    >>> parse_query("123\t8")
+    ([1, 2, 3], 8)
+    """
+    *roll_split, sum_str = line.split()
+    if len(roll_split) == 1:
+        roll_split = list(roll_split[0])
+    return [int(v) for v in roll_split], int(sum_str)
+
+
+def answer_file(advisor: Advisor, input_file: Iterable[str], output_file) -> None:
+    """
+    Answer every query in "input_file". Nothing is written if any line is
+    malformed or impossible; the ValueError names the first such line.
+    """
+    queries = []
+    line_numbers = []
+    for i, line in enumerate(input_file, 1):
+        if not line.strip():
+            continue
+        try:
+            queries.append(parse_query(line))
+        except ValueError:
+            raise ValueError("line %s: expected a roll and a sum" % i)
+        line_numbers.append(i)
+    try:
+        answers = advisor.answer_batch(queries)
+    except ValueError:
+        # Find the line of the first invalid query.
+        for i, query in zip(line_numbers, queries):
+            try:
+                advisor.answer_batch([query])
+            except ValueError as e:
+                raise ValueError("line %s: %s" % (i, e))
+        raise
+    for (roll, s), answer in zip(queries, answers):
+        output_file.write(
+            "%s\t%s\t%s\t%.6f\t%.6f\t%.6f\n" % ("".join(map(str, roll)), s, *answer)
+        )
+
+
+def parse_request(request: object) -> tuple[list[int], int | None]:
+    """
+    Check the shape of an advice request and return its roll and sum.
+    Raises ValueError with a message for the client if it is malformed.
+
+    >>> parse_request({"roll": [1, 2, 3], "sum": 4})
+    ([1, 2, 3], 4)
+    >>> parse_request({"roll": [1, 2, 3], "sum": True})
+    Traceback (most recent call last):
+      ...
+    ValueError: "sum" must be an integer
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+    roll = request.get("roll")
+    if not isinstance(roll, list) or not all(
+        isinstance(v, int) and not isinstance(v, bool) for v in roll
+    ):
+        raise ValueError('"roll" must be a list of integers')
+    current_sum = request.get("sum")
+    if current_sum is not None and (
+        not isinstance(current_sum, int) or isinstance(current_sum, bool)
+    ):
+        raise ValueError('"sum" must be an integer')
+    return roll, current_sum
+
+
+async def serve_advice(
+    advisor: Advisor,
+    host: str | None = None,
+    port: int | None = None,
+    path: str | None = None,
+) -> None:
+    """
+    Serve advice as line-delimited JSON over TCP, or over a Unix socket
+    if "path" is given. Each request line is an Advisor query, and each
+    response line is its answer or {"error": message}. The request
+    {"stats": true} returns the request counters instead. Malformed
+    requests get a fixed error message, see parse_request.
+    """
+    counters: collections.Counter[str] = collections.Counter()
+    started = time.monotonic()
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        counters["connections"] += 1
+        try:
+            async for line in reader:
+                t = time.perf_counter()
+                counters["requests"] += 1
+                response: dict[str, object]
+                try:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        raise ValueError("Request must be a line of JSON")
+                    if isinstance(request, dict) and request.get("stats") is True:
+                        response = dict(counters)
+                        response["uptime"] = time.monotonic() - started
+                    else:
+                        response = advisor.advise(*parse_request(request))
+                except ValueError as e:
+                    # Only our own messages: parse_request, roll_error and
+                    # the impossible sums in Advisor.advise.
+                    counters["errors"] += 1
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                counters["busy_us"] += round((time.perf_counter() - t) * 1e6)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if path is not None:
+        server = await asyncio.start_unix_server(handle, path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
-    parser.parse_args()
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="serve advice over TCP")
+    parser.add_argument("--unix-socket", help="serve advice over a Unix socket")
+    parser.add_argument(
+        "--batch",
+        type=argparse.FileType("r"),
+        help='answer the queries in a file of lines "roll sum" (- for stdin)',
+    )
+    args = parser.parse_args()
+    use_cache = not args.no_cache
 
     dice_count = 6
     sides = 6
@@ -81,45 +392,48 @@ def main() -> None:
 
     print(
         "Compute utility-maximizing strategy for %d %d-sided dice..."
-        % (dice_count, sides)
+        % (dice_count, sides),
+        file=sys.stdout if args.batch is None else sys.stderr,
     )
-    values, strategy = solve_game(dice_count, sides, my_utility)
+    utilities = [my_utility, is_below, is_above]
+    solutions: Sequence[tuple[Sequence[Sequence[Any]], Strategy]]
+    if use_cache:
+        solutions = cached_solve_games(dice_count, sides, utilities)
+    else:
+        solutions = solve_games(dice_count, sides, utilities, "integer")
+    advisor = Advisor(dice_count, sides, solutions)
+    if args.batch is not None:
+        try:
+            answer_file(advisor, args.batch, sys.stdout)
+        except ValueError as e:
+            raise SystemExit("%s: %s" % (args.batch.name, e))
+        return
+    if args.port is not None or args.unix_socket is not None:
+        print("Serving advice")
+        asyncio.run(serve_advice(advisor, args.host, args.port, args.unix_socket))
+        return
 
-    below_max_prob = roll_value_optimal(dice_count, sides, is_below)
-    above_max_prob = roll_value_optimal(dice_count, sides, is_above)
     while True:
         roll: list[int] = input_roll(dice_count, sides)
         min_sum = dice_count - len(roll)
         max_sum = (dice_count - len(roll)) * sides
-        roll.sort()
-        roll_z = [v - 1 for v in roll]
-        rerolls = [
-            describe_keep_reroll(dice_count, sides, strategy, roll, s)
-            for s in range(min_sum, max_sum + 1)
-        ]
+        advice = advisor.advise(roll)
         if min_sum == max_sum:
-            (reroll,) = rerolls
-            print("I would %s" % reroll)
+            print("I would %s" % advice["advice"][0]["action"])
             print(
                 "If you decide to go under, your chance is at most "
-                + "{:.2%}.\n".format(float(below_max_prob(roll_z, 0)))
-                + "Otherwise, your chance is at most {:.2%}.".format(
-                    float(above_max_prob(roll_z, 0))
-                )
+                + "{:.2%}.\n".format(advice["below"])
+                + "Otherwise, your chance is at most {:.2%}.".format(advice["above"])
             )
         else:
-            i = min_sum
-            for reroll, ss in itertools.groupby(rerolls):
-                j = i + len(list(ss))
-                if i == min_sum and j == max_sum + 1:
+            for a in advice["advice"]:
+                i, j, reroll = a["from"], a["to"], a["action"]
+                if i == min_sum and j == max_sum:
                     print("I would %s" % reroll)
-                elif i == j - 1:
+                elif i == j:
                     print("If you have %s, I would %s" % (i, reroll))
                 else:
-                    print(
-                        "If you have between %s and %s, I would %s" % (i, j - 1, reroll)
-                    )
-                i = j
+                    print("If you have between %s and %s, I would %s" % (i, j, reroll))
 
 
 if __name__ == "__main__":
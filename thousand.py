@@ -1,11 +1,89 @@
 import argparse
+import array
 import collections
+import concurrent.futures
 import fractions
 import functools
+import heapq
 import itertools
+import json
+import math
 import operator
+import os
 import random
-from typing import Iterable, Iterator, Sequence
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
+import cache
+import instrument
+import rolls
+
+# Bump this whenever a change to the solver changes its results,
+# so that solutions cached by cached_solve_game are recomputed.
+SOLVER_VERSION = 2
+
+
+class Rules(NamedTuple):
+    """
+    The rules of a variant of the game, in points. The solver counts
+    scores in units of "unit" points, so every score must be a multiple
+    of it; a Rules is hashable, and the tables compiled from it by
+    action_table and grouped_actions are cached per Rules.
+
+    >>> Rules().max_score, Rules(goal=5000).max_score
+    (200, 100)
+    >>> Rules(unit=100).check()
+    Traceback (most recent call last):
+      ...
+    ValueError: Rules.five = 50 is not a positive multiple of unit = 100
+    """
+
+    # Reaching "goal" points ends the game.
+    goal: int = 10000
+    unit: int = 50
+    # Points are only kept in the first turn that gets more than "opening",
+    opening: int = 1000
+    # and from "endgame" points only in the turn that reaches "goal".
+    endgame: int = 9000
+    three_pairs: int = 1000
+    six_distinct: int = 1500
+    # A single 1 or 5. The 1 is side 0, the 5 is side 4.
+    one: int = 100
+    five: int = 50
+    # Three 1s, and three of a kind k for k > 1 are k * triple_factor.
+    # Each die after the third adds the score of the three again, so four
+    # 1s are 2 * triple_ones.
+    triple_ones: int = 1000
+    triple_factor: int = 100
+
+    @property
+    def max_score(self):
+        return self.goal // self.unit
+
+    def check(self):
+        """
+        Raise ValueError naming the first field that is not a multiple
+        of unit (or is not positive, for the goal and the scores);
+        returns the Rules otherwise.
+        """
+        if not isinstance(self.unit, int) or self.unit <= 0:
+            raise ValueError("Rules.unit = %r is not a positive integer" % self.unit)
+        for field in self._fields:
+            v = getattr(self, field)
+            if field in ("opening", "endgame"):
+                if not isinstance(v, int) or v < 0 or v % self.unit:
+                    raise ValueError(
+                        "Rules.%s = %r is not a multiple of unit = %r"
+                        % (field, v, self.unit)
+                    )
+            elif not isinstance(v, int) or v <= 0 or v % self.unit:
+                raise ValueError(
+                    "Rules.%s = %r is not a positive multiple of unit = %r"
+                    % (field, v, self.unit)
+                )
+        return self
+
+
+DEFAULT_RULES = Rules()
 
 
 def product(iterable: Iterable[int]) -> int:
@@ -36,35 +114,38 @@ def permutations(s: Iterable[int]) -> int:
 
 
 def outcomes(sides: int, dice_count: int) -> Iterator[tuple[Sequence[int], int]]:
-    outcomes_ = itertools.combinations_with_replacement(range(sides), dice_count)
-    n_outcomes = 0
-    n_distinct = 0
-    for outcome in outcomes_:
-        multiplicity = permutations(outcome)
-        n_outcomes += multiplicity
-        n_distinct += 1
-        yield outcome, multiplicity
-    assert n_outcomes == sides**dice_count
-    assert n_distinct == (
-        factorial(dice_count + sides - 1)
-        // (factorial(dice_count) * factorial(sides - 1))
+    return rolls.outcomes(sides, dice_count)
+
+
+@functools.lru_cache(maxsize=None)
+def outcome_histograms(sides, dice_count):
+    """
+    The histogram and multiplicity of every outcome. The histograms are
+    tuples, so the cached table cannot be changed by its callers.
+    """
+    return tuple(
+        (histogram(collections.Counter(outcome), sides), multiplicity)
+        for outcome, multiplicity in outcomes(sides, dice_count)
     )
 
 
 def outcomes_counter(sides, dice_count):
     return (
-        (collections.Counter(outcome), multiplicity)
-        for outcome, multiplicity in outcomes(sides, dice_count)
+        (histogram_counter(h), multiplicity)
+        for h, multiplicity in outcome_histograms(sides, dice_count)
     )
 
 
-def actions(counter):
+def actions(counter, rules=DEFAULT_RULES):
     """
     >>> sorted(actions({0: 2, 3: 2, 5: 2}))
     [(0, 20), (4, 4), (5, 2)]
     >>> sorted(actions({0: 4}))
     [(0, 40), (1, 20), (2, 4), (3, 2)]
+    >>> sorted(actions({0: 4}, Rules(unit=10, triple_ones=300)))
+    [(0, 60), (1, 30), (2, 20), (3, 10)]
     """
+    u = rules.unit
     dice_count = sum(counter.values())
 
     # If n is in keep_counts[i], then we may keep n of keep_keys[i].
@@ -83,10 +164,10 @@ def actions(counter):
     pairs = sum(1 for k in counter if counter[k] >= 2)
     if pairs >= 3:
         # 3 pairs -- take all dice
-        yield (0, 1000 // 50)
+        yield (0, rules.three_pairs // u)
     if len(counter) >= 6:
         # 6 distinct -- take all dice
-        yield (0, 1500 // 50)
+        yield (0, rules.six_distinct // u)
     for counts in itertools.product(*keep_counts):
         if not any(counts):
             # We can't take no dice.
@@ -95,52 +176,177 @@ def actions(counter):
         for k, c in zip(keep_keys, counts):
             if c >= 3:
                 if k == 0:
-                    score += 1000 // 50 * (c - 2)
+                    score += rules.triple_ones // u * (c - 2)
                 else:
-                    score += (k + 1) * 100 // 50 * (c - 2)
+                    score += (k + 1) * rules.triple_factor // u * (c - 2)
             elif k == 0:
-                score += 100 // 50 * c
+                score += rules.one // u * c
             elif k == 4:
-                score += 50 // 50 * c
+                score += rules.five // u * c
         yield (dice_count - sum(counts), score)
 
 
-def can_keep_points(starting_score, current_score):
-    if starting_score == 0 and current_score <= 1000 // 50:
+def histogram(counter, sides):
+    """
+    The canonical form of an outcome: the number of dice showing each side.
+
+    >>> histogram(collections.Counter([0, 3, 3]), 6)
+    (1, 0, 0, 2, 0, 0)
+    """
+    return tuple(counter.get(k, 0) for k in range(sides))
+
+
+def histogram_counter(h):
+    """
+    A new Counter with the outcome of the histogram "h".
+
+    >>> histogram_counter((1, 0, 0, 2, 0, 0))
+    Counter({3: 2, 0: 1})
+    """
+    return collections.Counter({k: v for k, v in enumerate(h) if v})
+
+
+@functools.lru_cache(maxsize=None)
+@instrument.timed("thousand.action_table")
+def action_table(sides, dice_count, rules=DEFAULT_RULES):
+    """
+    Maps the histogram of every outcome of rolling 1 to dice_count dice
+    to the sorted tuple of its distinct actions.
+
+    >>> action_table(6, 6)[(2, 0, 0, 2, 0, 2)]
+    ((0, 20), (4, 4), (5, 2))
+    """
+    rules.check()
+    table = {}
+    for n in range(1, dice_count + 1):
+        for counter, multiplicity in outcomes_counter(sides, n):
+            instrument.count("thousand.actions")
+            table[histogram(counter, sides)] = tuple(
+                sorted(set(actions(counter, rules)))
+            )
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def outcome_actions(sides, dice_count, rules=DEFAULT_RULES):
+    """
+    Same as outcome_histograms, but with the actions of each outcome
+    from action_table as a third element.
+    """
+    table = action_table(sides, dice_count, rules)
+    return tuple(
+        (h, multiplicity, table[h])
+        for h, multiplicity in outcome_histograms(sides, dice_count)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def pareto_actions(a):
+    """
+    Among actions that leave the same number of dice to reroll,
+    keep only the one with the highest score.
+
+    >>> pareto_actions(((0, 3), (1, 1), (1, 2), (2, 1)))
+    ((0, 3), (1, 2), (2, 1))
+    """
+    best = {}
+    for reroll_dice, score in a:
+        best[reroll_dice] = max(best.get(reroll_dice, score), score)
+    return tuple(sorted(best.items()))
+
+
+def can_keep_points(starting_score, current_score, rules=DEFAULT_RULES):
+    if starting_score == 0 and current_score <= rules.opening // rules.unit:
         return False
-    if starting_score >= 9000 // 50 and current_score + starting_score < 10000 // 50:
+    if (
+        starting_score >= rules.endgame // rules.unit
+        and current_score + starting_score < rules.max_score
+    ):
         return False
     return True
 
 
+def end_turn(starting_score, current_score, rules=DEFAULT_RULES):
+    """
+    The starting score of the next turn after ending a turn with
+    "current_score", as in Values.play and Values.stop: reaching the
+    goal ends the game, and otherwise the points are only kept if
+    can_keep_points.
+
+    >>> end_turn(0, 20), end_turn(0, 21), end_turn(180, 5), end_turn(180, 20)
+    (0, 21, 180, 200)
+    """
+    if starting_score + current_score >= rules.max_score or can_keep_points(
+        starting_score, current_score, rules
+    ):
+        return starting_score + current_score
+    return starting_score
+
+
 def compute_values_single(
     dice_count, sides, remaining_dice, starting_score, current_score, strategy, values
+):
+    (v,) = compute_values_single_many(
+        dice_count,
+        sides,
+        remaining_dice,
+        starting_score,
+        current_score,
+        [strategy],
+        [values],
+    )
+    return v
+
+
+def compute_values_single_many(
+    dice_count,
+    sides,
+    remaining_dice,
+    starting_score,
+    current_score,
+    strategies,
+    values_list,
 ):
     assert remaining_dice >= 1
-    # At the end, tmp_value will be k**n times the expected utility.
-    tmp_value = 0
-
-    for counter, multiplicity in outcomes_counter(sides, remaining_dice):
-        a = list(actions(counter))
-        assert all(s > 0 for r, s in a)
-        if a:
-            action_index, do_continue = strategy(
-                counter, starting_score, current_score, a
-            )
-            reroll_dice, keep_score = a[action_index]
-            if do_continue:
-                result = values.play(
-                    reroll_dice or dice_count,
-                    starting_score,
-                    current_score + keep_score,
+    # At the end, tmp_values[i] will be k**n times the expected utility
+    # of strategies[i].
+    tmp_values = [0 for strategy in strategies]
+    table = outcome_actions(sides, remaining_dice, values_list[0].rules)
+    instrument.count("thousand.value_lookups", len(table) * len(strategies))
+
+    for h, multiplicity, a in table:
+        counter = histogram_counter(h)
+        for i, (strategy, values) in enumerate(zip(strategies, values_list)):
+            if a:
+                action_index, do_continue = strategy(
+                    counter, starting_score, current_score, a
                 )
+                reroll_dice, keep_score = a[action_index]
+                if do_continue:
+                    result = values.play(
+                        reroll_dice or dice_count,
+                        starting_score,
+                        current_score + keep_score,
+                    )
+                else:
+                    result = values.stop(starting_score, current_score + keep_score)
             else:
-                result = values.stop(starting_score, current_score + keep_score)
-        else:
-            result = values.nothing(starting_score)
-        tmp_value += multiplicity * result
+                result = values.nothing(starting_score)
+            tmp_values[i] += multiplicity * result
+
+    return [divide(t, sides**remaining_dice) for t in tmp_values]
+
 
-    return fractions.Fraction(tmp_value, sides**remaining_dice)
+def divide(a, b):
+    """
+    Exact division, unless we are computing with floats.
+
+    >>> divide(3, 6), divide(0.5, 2)
+    (Fraction(1, 2), 0.25)
+    """
+    if isinstance(a, float):
+        return a / b
+    return fractions.Fraction(a, b)
 
 
 def ensure_numeric(f):
@@ -156,8 +362,9 @@ def ensure_numeric(f):
 
 
 class Values(object):
-    def __init__(self, dice_count, utility):
-        max_score = 10000 // 50
+    def __init__(self, dice_count, utility, rules=DEFAULT_RULES):
+        self.rules = rules
+        self.max_score = max_score = rules.max_score
         self._values = [
             [[None for c in range(max_score - s + 1)] for s in range(max_score + 1)]
             for r in range(dice_count)
@@ -165,7 +372,7 @@ class Values(object):
         self._utility = [utility(s) for s in range(max_score + 1)]
 
     def play(self, remaining_dice, starting_score, current_score):
-        max_score = 10000 // 50
+        max_score = self.max_score
         if starting_score + current_score >= max_score:
             return self.utility(max_score)
         current_score = min(current_score, max_score - starting_score)
@@ -179,13 +386,13 @@ class Values(object):
         return v
 
     def set_value(self, remaining_dice, starting_score, current_score, v):
-        max_score = 10000 // 50
+        max_score = self.max_score
         assert starting_score <= max_score
         assert current_score <= max_score - starting_score
         self._values[remaining_dice - 1][starting_score][current_score] = v
 
     def stop(self, starting_score, current_score):
-        if can_keep_points(starting_score, current_score):
+        if can_keep_points(starting_score, current_score, self.rules):
             return self.utility(starting_score + current_score)
         else:
             return self.utility(starting_score)
@@ -194,44 +401,156 @@ class Values(object):
         return self.utility(starting_score)
 
     def utility(self, score):
-        if score > 10000 // 50:
-            return self._utility[10000 // 50]
+        if score > self.max_score:
+            return self._utility[self.max_score]
         else:
             return self._utility[score]
 
+    def set_utility(self, score, v):
+        self._utility[score] = v
+
+    def row(self, remaining_dice, starting_score):
+        """
+        The values for all current scores with the given remaining dice
+        and starting score, indexed by current score.
+        """
+        return self._values[remaining_dice - 1][starting_score]
+
+
+class ArrayValues(Values):
+    """
+    Same as Values, but the values are floats stored in one flat
+    array of doubles, with NaN for the states that are not filled out.
+    For each number of remaining dice, the states are stored by starting
+    score and then by current score, so
+    _offsets[starting_score] + (remaining_dice - 1) * _stride + current_score
+    is the index of a state.
+
+    >>> v = ArrayValues(6, lambda s: s / 2)
+    >>> v.set_value(6, 100, 20, 1.5)
+    >>> v.play(6, 100, 20), v.stop(100, 20), v.play(6, 150, 50)
+    (1.5, 60.0, 100.0)
+    >>> v.row(6, 200).tolist()
+    [nan]
+    """
+
+    def __init__(self, dice_count, utility, cells=None, rules=DEFAULT_RULES):
+        self.rules = rules
+        self.max_score = max_score = rules.max_score
+        self._offsets = list(
+            itertools.accumulate(
+                (max_score - s + 1 for s in range(max_score)), initial=0
+            )
+        )
+        self._stride = self._offsets[-1] + 1
+        if cells is None:
+            cells = array.array("d", [math.nan]) * (dice_count * self._stride)
+        assert len(cells) == dice_count * self._stride
+        self._cells = cells
+        self._utility = [utility(s) for s in range(max_score + 1)]
+
+    def _index(self, remaining_dice, starting_score, current_score):
+        return (
+            self._offsets[starting_score]
+            + (remaining_dice - 1) * self._stride
+            + current_score
+        )
+
+    def play(self, remaining_dice, starting_score, current_score):
+        max_score = self.max_score
+        if starting_score + current_score >= max_score:
+            return self.utility(max_score)
+        v = self._cells[self._index(remaining_dice, starting_score, current_score)]
+        if v != v:
+            print(
+                "Try to evaluate (%s, %s, %s)"
+                % (starting_score, current_score, remaining_dice)
+            )
+        assert v == v
+        return v
+
+    def set_value(self, remaining_dice, starting_score, current_score, v):
+        max_score = self.max_score
+        assert starting_score <= max_score
+        assert current_score <= max_score - starting_score
+        self._cells[self._index(remaining_dice, starting_score, current_score)] = v
+
+    def row(self, remaining_dice, starting_score):
+        start = self._index(remaining_dice, starting_score, 0)
+        stop = start + self.max_score - starting_score + 1
+        return memoryview(self._cells)[start:stop]
+
 
 def fill_out_values(dice_count, sides, strategy, values):
-    max_score = 10000 // 50
-    for starting_score in range(max_score, -1, -1):
-        print("Fill out %s" % starting_score, flush=True)
+    fill_out_values_many(dice_count, sides, [strategy], [values])
+    return values
+
+
+def fill_out_values_many(
+    dice_count, sides, strategies, values_list, starting_scores=None, progress=None
+):
+    max_score = values_list[0].max_score
+    if starting_scores is None:
+        starting_scores = range(max_score, -1, -1)
+    strategies = [instrument.wrap("thousand.strategy", s) for s in strategies]
+    work = ScoreWork(starting_scores, progress, max_score)
+    for starting_score in starting_scores:
         for current_score in range(max_score - starting_score, -1, -1):
             for remaining_dice in range(1, dice_count + 1):
-                values.set_value(
+                vs = compute_values_single_many(
+                    dice_count,
+                    sides,
                     remaining_dice,
                     starting_score,
                     current_score,
-                    compute_values_single(
-                        dice_count,
-                        sides,
-                        remaining_dice,
-                        starting_score,
-                        current_score,
-                        strategy,
-                        values,
-                    ),
+                    strategies,
+                    values_list,
                 )
-    return values
+                for values, v in zip(values_list, vs):
+                    values.set_value(remaining_dice, starting_score, current_score, v)
+        work.done(starting_score)
+    return values_list
+
+
+class ScoreWork(object):
+    """
+    Reports to a Progress how many of the states with the given
+    starting scores have been filled out, as each starting score is done.
+    """
+
+    def __init__(self, starting_scores, progress, max_score):
+        self.progress = progress
+        self.states = {s: max_score - s + 1 for s in starting_scores}
+        self.total = sum(self.states.values())
+        self.finished = 0
 
+    def done(self, starting_score):
+        self.finished += self.states[starting_score]
+        if self.progress is not None:
+            self.progress(self.finished, self.total)
 
-def compute_values(dice_count, sides, strategy, utility):
+
+def compute_values(dice_count, sides, strategy, utility, rules=DEFAULT_RULES):
     utility = ensure_numeric(utility)
-    values = Values(dice_count, utility)
+    values = Values(dice_count, utility, rules)
     fill_out_values(dice_count, sides, strategy, values)
     return values
 
 
-def compute_value(dice_count, sides, strategy, utility):
-    values = compute_values(dice_count, sides, strategy, utility)
+def compute_values_many(dice_count, sides, strategies, utility, rules=DEFAULT_RULES):
+    """
+    Same as [compute_values(dice_count, sides, s, utility) for s in strategies],
+    but the outcomes and actions of each state are only computed once
+    for all the strategies.
+    """
+    utility = ensure_numeric(utility)
+    values_list = [Values(dice_count, utility, rules) for strategy in strategies]
+    fill_out_values_many(dice_count, sides, strategies, values_list)
+    return values_list
+
+
+def compute_value(dice_count, sides, strategy, utility, rules=DEFAULT_RULES):
+    values = compute_values(dice_count, sides, strategy, utility, rules)
     return values.play(dice_count, 0, 0)
 
 
@@ -256,7 +575,8 @@ def optimizing_strategy(dice_count, values):
                 best_reroll = i
                 best_continue = True
                 best_value = continue_score
-            if reroll_dice and best_reroll is None or best_value < stop_score:
+            # We may only stop if there are dice left to reroll.
+            if reroll_dice and best_value < stop_score:
                 best_reroll = i
                 best_continue = False
                 best_value = stop_score
@@ -265,21 +585,25 @@ def optimizing_strategy(dice_count, values):
     return reroll_strategy
 
 
-def random_strategy(counter, starting_score, current_score, actions):
-    i = random.randrange(len(actions))
+def random_strategy(counter, starting_score, current_score, actions, rng=random):
+    """
+    Choose uniformly at random, drawing from "rng" (by default the
+    global random module), which can be a random.Random.
+    """
+    i = rng.randrange(len(actions))
     reroll_dice, add_score = actions[i]
     if reroll_dice:
-        do_continue = random.choice([False, True])
+        do_continue = rng.choice([False, True])
     else:
         do_continue = True
     return i, do_continue
 
 
-def max_strategy(counter, starting_score, current_score, actions):
+def max_strategy(counter, starting_score, current_score, actions, rules=DEFAULT_RULES):
     i = max(range(len(actions)), key=lambda i: actions[i][1])
     reroll_dice, add_score = actions[i]
     if reroll_dice:
-        if can_keep_points(starting_score, current_score + add_score):
+        if can_keep_points(starting_score, current_score + add_score, rules):
             do_continue = False
         else:
             do_continue = True
@@ -288,14 +612,578 @@ def max_strategy(counter, starting_score, current_score, actions):
     return i, do_continue
 
 
-def solve_game(dice_count, sides, utility):
+def solve_game(
+    dice_count,
+    sides,
+    utility,
+    processes=1,
+    progress=None,
+    rules=DEFAULT_RULES,
+    numeric="fraction",
+):
+    """
+    With a fixed utility, the states with one starting score never
+    depend on the states with another starting score, so with
+    processes > 1 (or None for one per CPU) the starting scores are
+    filled out in parallel by parallel_fill_out_turns.
+    "progress" is called with the number of states filled out so far
+    and in total.
+
+    With numeric="fraction", the values are exact. With numeric="float",
+    they are floats in ArrayValues, which are within float_error_bound
+    of the exact values, and certify_strategy tells whether the strategy
+    is exactly optimal.
+    """
     utility = ensure_numeric(utility)
-    values = Values(dice_count, utility)
+    if numeric == "fraction":
+        values = Values(dice_count, utility, rules)
+    elif numeric == "float":
+        values = ArrayValues(dice_count, lambda s: float(utility(s)), rules=rules)
+    else:
+        raise ValueError("Unknown numeric mode %r" % (numeric,))
     strategy = optimizing_strategy(dice_count, values)
-    fill_out_values(dice_count, sides, strategy, values)
+    if processes == 1:
+        starting_scores = range(rules.max_score, -1, -1)
+        work = ScoreWork(starting_scores, progress, rules.max_score)
+        for starting_score in starting_scores:
+            fill_out_turn(dice_count, sides, starting_score, values)
+            work.done(starting_score)
+    else:
+        parallel_fill_out_turns(dice_count, sides, values, processes, progress)
     return values, strategy
 
 
+def parallel_fill_out_turns(dice_count, sides, values, processes=None, progress=None):
+    """
+    Run fill_out_turn for every starting score in a process pool.
+    A worker only needs the utility table, which is sent once per task,
+    and sends back the states of its starting scores.
+    """
+    max_score = values.max_score
+    processes = processes or os.cpu_count() or 1
+    # Interleave the starting scores, since a lower starting score
+    # has more states, and use a few tasks per process to even out the load.
+    tasks = min(4 * processes, max_score + 1)
+    bands = [range(max_score - k, -1, -tasks) for k in range(tasks)]
+    utility_row = [values.utility(s) for s in range(max_score + 1)]
+    work = ScoreWork(range(max_score + 1), progress, max_score)
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        results = executor.map(
+            fill_out_turns,
+            itertools.repeat(dice_count),
+            itertools.repeat(sides),
+            itertools.repeat(utility_row),
+            bands,
+            itertools.repeat(values.rules),
+        )
+        for band in results:
+            for starting_score, rows in band:
+                for remaining_dice, row in enumerate(rows, 1):
+                    for current_score, v in enumerate(row):
+                        values.set_value(
+                            remaining_dice, starting_score, current_score, v
+                        )
+                work.done(starting_score)
+    return values
+
+
+def fill_out_turns(
+    dice_count, sides, utility_row, starting_scores, rules=DEFAULT_RULES
+):
+    values = Values(dice_count, utility_row.__getitem__, rules)
+    for starting_score in starting_scores:
+        fill_out_turn(dice_count, sides, starting_score, values)
+    return [
+        (
+            starting_score,
+            [
+                list(values.row(remaining_dice, starting_score))
+                for remaining_dice in range(1, dice_count + 1)
+            ],
+        )
+        for starting_score in starting_scores
+    ]
+
+
+def cached_solve_game(
+    dice_count,
+    sides,
+    utility,
+    progress=None,
+    rules=DEFAULT_RULES,
+    numeric="fraction",
+):
+    """
+    Same as solve_game, but the values are stored in the on-disk cache
+    and loaded from there if the same game has been solved before.
+
+    Exact values are stored as packed Fractions and floats as raw
+    doubles (see store_values), and both load back the same values and
+    strategy as a fresh solve:
+
+    >>> import tempfile, unittest.mock
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> states = [(r, i, s, c) for r in (1, 2, 3)
+    ...     for i in range(len(outcome_actions(6, r, rules)))
+    ...     for s in range(20) for c in range(20 - s)]
+    >>> def decisions(strategy):
+    ...     return [strategy(None, s, c, list(outcome_actions(6, r, rules)[i][2]))
+    ...         for r, i, s, c in states if outcome_actions(6, r, rules)[i][2]]
+    >>> u = lambda s: s * s
+    >>> with tempfile.TemporaryDirectory() as d:
+    ...     with unittest.mock.patch.dict(os.environ, THIRTYGAME_CACHE=d):
+    ...         for numeric in ("fraction", "float"):
+    ...             solved = cached_solve_game(3, 6, u, rules=rules, numeric=numeric)
+    ...             loaded, strategy = cached_solve_game(
+    ...                 3, 6, u, rules=rules, numeric=numeric
+    ...             )
+    ...             values, expected = solve_game(3, 6, u, rules=rules, numeric=numeric)
+    ...             print(type(loaded).__name__,
+    ...                   all(loaded.play(r, s, c) == values.play(r, s, c)
+    ...                       for r, i, s, c in states),
+    ...                   decisions(strategy) == decisions(expected))
+    ...         files = len(os.listdir(d))
+    Values True True
+    ArrayValues True True
+    >>> files
+    2
+    """
+    utility = ensure_numeric(utility)
+    utility_row = [utility(s) for s in range(rules.max_score + 1)]
+    game = "thousand" if numeric == "fraction" else "thousand-%s" % numeric
+    path = cache.cache_path(
+        game, SOLVER_VERSION, dice_count, sides, utility_row, rules_key(rules)
+    )
+    values = load_values(path, dice_count, rules)
+    if values is None:
+        values, strategy = solve_game(
+            dice_count,
+            sides,
+            utility,
+            progress=progress,
+            rules=rules,
+            numeric=numeric,
+        )
+        store_values(path, dice_count, sides, values)
+        return values, strategy
+    return values, optimizing_strategy(dice_count, values)
+
+
+def cached_solve_turns(
+    dice_count, sides, tolerance=1e-9, progress=None, rules=DEFAULT_RULES
+):
+    """
+    Same as solve_turns, but the values are stored in the on-disk cache
+    and loaded from there if the same game has been solved before.
+    Returns the values and the strategy.
+
+    >>> import tempfile, unittest.mock
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> with tempfile.TemporaryDirectory() as d:
+    ...     with unittest.mock.patch.dict(os.environ, THIRTYGAME_CACHE=d):
+    ...         solved = cached_solve_turns(3, 6, rules=rules)[0]
+    ...         loaded = cached_solve_turns(3, 6, rules=rules)[0]
+    ...         files = len(os.listdir(d))
+    >>> files, type(loaded).__name__
+    (1, 'ArrayValues')
+    >>> all(loaded.play(r, s, c) == solved.play(r, s, c)
+    ...     for r in (1, 2, 3) for s in range(20) for c in range(20 - s))
+    True
+    """
+    path = cache.cache_path(
+        "thousand-turns",
+        SOLVER_VERSION,
+        dice_count,
+        sides,
+        [tolerance],
+        rules_key(rules),
+    )
+    values = load_values(path, dice_count, rules)
+    if values is None:
+        values, strategy, iterations = solve_turns(
+            dice_count, sides, tolerance, progress=progress, rules=rules
+        )
+        store_values(path, dice_count, sides, values)
+        return values, strategy
+    return values, optimizing_strategy(dice_count, values)
+
+
+def rules_key(rules):
+    """
+    The rules for cache.cache_path, which leaves out the default rules
+    so that their cache files keep their names.
+    """
+    return () if rules == DEFAULT_RULES else tuple(rules)
+
+
+def store_values(path, dice_count, sides, values):
+    """
+    An ArrayValues is stored as raw doubles, which load_values maps
+    straight back into memory; a Values is stored as packed Fractions.
+    """
+    meta = {"dice_count": dice_count, "sides": sides}
+    if isinstance(values, ArrayValues):
+        meta["format"] = "float64"
+        sections = {
+            "utility": array.array("d", values._utility).tobytes(),
+            "cells": values._cells.tobytes(),
+        }
+    else:
+        offsets, data = cache.pack_fractions(
+            itertools.chain(
+                values._utility, (v for r in values._values for row in r for v in row)
+            )
+        )
+        sections = {"offsets": offsets.tobytes(), "data": data}
+    cache.write_tables(path, meta, sections)
+
+
+def load_values(path, dice_count, rules=DEFAULT_RULES):
+    tables = cache.read_tables(path)
+    if tables is None:
+        return None
+    meta, sections = tables
+    if meta.get("format") == "float64":
+        utility = sections["utility"].cast("d")
+        return ArrayValues(
+            dice_count, utility.__getitem__, sections["cells"].cast("d"), rules
+        )
+    cells = cache.PackedFractions(sections["offsets"], sections["data"])
+    utility = cells[: rules.max_score + 1]
+    values = Values(dice_count, utility.__getitem__, rules)
+    i = len(utility)
+    for r in values._values:
+        for starting_score, row in enumerate(r):
+            r[starting_score] = cells[i : i + len(row)]
+            i += len(row)
+    return values
+
+
+@functools.lru_cache(maxsize=None)
+def grouped_actions(sides, dice_count, prune=False, rules=DEFAULT_RULES):
+    """
+    The outcomes of rolling dice_count dice, grouped by their actions.
+    Returns a tuple of (multiplicity, actions) where actions is a sorted
+    tuple of distinct (reroll_dice, score) pairs and multiplicity is the
+    total multiplicity of the outcomes with exactly those actions.
+    With prune=True, the actions are the pareto_actions.
+
+    >>> grouped_actions(6, 1)
+    ((4, ()), (1, ((0, 1),)), (1, ((0, 2),)))
+    """
+    groups = {}
+    for h, multiplicity, a in outcome_actions(sides, dice_count, rules):
+        if prune:
+            a = pareto_actions(a)
+        groups[a] = groups.get(a, 0) + multiplicity
+    return tuple((m, a) for a, m in sorted(groups.items()))
+
+
+@instrument.timed("thousand.fill_out_turn")
+def fill_out_turn(dice_count, sides, starting_score, values):
+    """
+    Fill out the values of all states with the given starting score
+    using the optimizing strategy, assuming values.utility(s) is already
+    known for s >= starting_score.
+    Returns the probability, under that strategy, that a turn started
+    with starting_score ends with starting_score.
+
+    Filling out a turn of a solution again leaves its value unchanged,
+    and in a game to 1000 that needs 300 points to get started, a first
+    turn mostly gets nowhere:
+
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> values = solve_turns(3, 6, 0, exact=True, rules=rules)[0]
+    >>> u = values.play(3, 0, 0)
+    >>> p = fill_out_turn(3, 6, 0, values)
+    >>> values.play(3, 0, 0) == u, round(float(p), 4)
+    (True, 0.8663)
+    """
+    rules = values.rules
+    max_score = rules.max_score
+    top = max_score - starting_score
+    instrument.count("thousand.states", (top + 1) * dice_count)
+    finished = values.utility(max_score)
+    # ending[c] is the value of ending the turn with current score c.
+    ending = [values.utility(starting_score + c) for c in range(top + 1)]
+    can_keep = [can_keep_points(starting_score, c, rules) for c in range(top + 1)]
+    # If a higher current score is never worse to end the turn with,
+    # then a higher current score is never worse in any state, and among
+    # actions that leave the same number of dice we only need the one
+    # with the highest score.
+    stop_values = [ending[0]]
+    stop_values += [ending[c] if can_keep[c] else ending[0] for c in range(top)]
+    stop_values.append(finished)
+    prune = all(a <= b for a, b in zip(stop_values, stop_values[1:]))
+    groups = [None] + [
+        grouped_actions(sides, r, prune, rules) for r in range(1, dice_count + 1)
+    ]
+    # Slopes are 0 or 1 of the same type as the values.
+    zero = ending[0] - ending[0]
+    one = zero + 1
+    # cells[r][c] is the pair (value, probability of ending at
+    # starting_score) for r remaining dice and current score c.
+    cells = [[None] * (top + 1) for r in range(dice_count + 1)]
+    for current_score in range(top, -1, -1):
+        for remaining_dice in range(1, dice_count + 1):
+            total = slope = zero
+            for multiplicity, a in groups[remaining_dice]:
+                if not a:
+                    best_value, best_slope = ending[0], one
+                else:
+                    best_value = best_slope = None
+                    for reroll_dice, add_score in a:
+                        c = current_score + add_score
+                        if c >= top:
+                            continue_value, continue_slope = finished, zero
+                        else:
+                            continue_value, continue_slope = cells[
+                                reroll_dice or dice_count
+                            ][c]
+                        if best_value is None or best_value < continue_value:
+                            best_value, best_slope = continue_value, continue_slope
+                        if not reroll_dice:
+                            continue
+                        if c >= top:
+                            stop_value, stop_slope = finished, zero
+                        elif can_keep[c]:
+                            stop_value, stop_slope = ending[c], zero
+                        else:
+                            stop_value, stop_slope = ending[0], one
+                        if best_value < stop_value:
+                            best_value, best_slope = stop_value, stop_slope
+                total += multiplicity * best_value
+                slope += multiplicity * best_slope
+            v = divide(total, sides**remaining_dice)
+            p = divide(slope, sides**remaining_dice)
+            cells[remaining_dice][current_score] = v, p
+            values.set_value(remaining_dice, starting_score, current_score, v)
+    return cells[dice_count][0][1]
+
+
+def float_error_bound(dice_count, sides, utility_row, rules=DEFAULT_RULES):
+    """
+    A bound on how far any value from solve_game with numeric="float"
+    can be from the exact value.
+
+    fill_out_turn computes each state as a sum of one term per group of
+    outcomes, multiplicity times the best of some values, divided by
+    sides**remaining_dice. Picking the best adds no error, and with K
+    terms, the rounding is at most gamma(K + 2) = (K + 2) * u / (1 -
+    (K + 2) * u) relative to the largest absolute value, where u = 2**-53,
+    on top of the error in the values it is computed from. A state only
+    depends on states with a higher current score and on the utilities,
+    so there are at most max_score + 1 such steps.
+
+    Checking the float values against the exact ones, for a game to 1000:
+
+    >>> rules = Rules(goal=1000, endgame=900, opening=300)
+    >>> u = [s * s for s in range(21)]
+    >>> bound = float_error_bound(3, 6, u, rules)
+    >>> approx = solve_game(3, 6, u.__getitem__, rules=rules, numeric="float")[0]
+    >>> exact = solve_game(3, 6, u.__getitem__, rules=rules)[0]
+    >>> max(abs(approx.play(r, s, c) - exact.play(r, s, c)) for r in (1, 2, 3)
+    ...     for s in range(21) for c in range(21 - s)) <= bound < 1e-10
+    True
+    >>> certify_strategy(3, 6, approx, bound)
+    0
+    """
+    unit = 2.0**-53
+    error = max(abs(fractions.Fraction(float(u)) - u) for u in utility_row)
+    largest = float(max(abs(u) for u in utility_row))
+    terms = max(
+        len(grouped_actions(sides, r, prune, rules))
+        for r in range(1, dice_count + 1)
+        for prune in (False, True)
+    )
+    gamma = (terms + 2) * unit / (1 - (terms + 2) * unit)
+    bound = float(error)
+    for step in range(rules.max_score + 1):
+        bound += gamma * (largest + bound)
+    return bound
+
+
+def certify_strategy(dice_count, sides, values, bound):
+    """
+    Count the decisions of optimizing_strategy(dice_count, values) where
+    the best option is less than 2 * bound better than the next best,
+    for values that are within "bound" of the exact values. Options
+    that lead to the same state are the same option. If there are no
+    such decisions, the strategy makes the same choice as with the exact
+    values in every state, so it is exactly optimal. Options that are
+    exactly as good also count, since rounding makes them near ties.
+    """
+    rules = values.rules
+    max_score = rules.max_score
+    uncertain = 0
+    for starting_score in range(max_score):
+        for current_score in range(max_score - starting_score):
+            for remaining_dice in range(1, dice_count + 1):
+                groups = grouped_actions(sides, remaining_dice, False, rules)
+                for multiplicity, a in groups:
+                    options = {}
+                    for reroll_dice, add_score in a:
+                        c = current_score + add_score
+                        score = starting_score + c
+                        if score >= max_score:
+                            options["end", max_score] = values.utility(max_score)
+                            continue
+                        r = reroll_dice or dice_count
+                        options["play", r, c] = values.play(r, starting_score, c)
+                        if not reroll_dice:
+                            continue
+                        if not can_keep_points(starting_score, c, rules):
+                            score = starting_score
+                        options["end", score] = values.stop(starting_score, c)
+                    if len(options) > 1:
+                        best, second = heapq.nlargest(2, options.values())
+                        if best - second < 2 * bound:
+                            uncertain += 1
+    return uncertain
+
+
+def solve_turns(
+    dice_count,
+    sides,
+    tolerance=1e-9,
+    initial=None,
+    exact=False,
+    progress=None,
+    rules=DEFAULT_RULES,
+):
+    """
+    Compute the strategy that minimizes the expected number of turns
+    needed to reach the goal, which is what play_game counts.
+
+    Let u(s) be minus the expected number of turns left when starting
+    a turn with score s, so u(rules.max_score) = 0. Ending a turn with
+    score s is then worth -1 + u(s), and values.play(dice_count, s, 0)
+    is u(s).
+
+    A turn can end with the score it started with, so u(s) depends on
+    itself. For each starting score s from the top down, we solve
+    u = F(u - 1), where F(y) is the value of a turn started at s when
+    ending it at s is worth y. F is the maximum of one affine function
+    per strategy, so Newton's method on it is policy iteration and stops
+    after a few iterations. The slope of F is the probability that the
+    turn ends at s, which fill_out_turn computes along with the values.
+    We stop when u changes by at most "tolerance".
+
+    With exact=True, the values are Fractions, and tolerance=0 gives
+    the exact solution. Otherwise, the values are floats in ArrayValues.
+    "initial" may give a guess of u(s) for every s to start from,
+    such as an earlier solution; by default u(s + 1) is used.
+    "progress" is called as in solve_game.
+
+    Returns the values, the strategy and the number of iterations
+    that were used for each starting score.
+
+    In a game to 1000, the floats agree with the exact solution, and
+    no starting score needs more than 4 iterations:
+
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> exact, strategy, iterations = solve_turns(3, 6, 0, exact=True, rules=rules)
+    >>> approx, strategy, iterations = solve_turns(3, 6, rules=rules)
+    >>> round(float(exact.play(3, 0, 0)), 6), max(iterations), sum(iterations)
+    (-14.225035, 4, 57)
+    >>> states = [(r, s, c) for r in (1, 2, 3) for s in range(20) for c in range(20 - s)]
+    >>> max(abs(approx.play(*k) - exact.play(*k)) for k in states) < 6e-12
+    True
+
+    Starting from the exact solution takes one iteration per score and
+    gives the same values:
+
+    >>> initial = [exact.play(3, s, 0) for s in range(21)]
+    >>> again, strategy, iterations = solve_turns(
+    ...     3, 6, 0, initial=initial, exact=True, rules=rules
+    ... )
+    >>> all(again.play(*k) == exact.play(*k) for k in states), sum(iterations)
+    (True, 20)
+    """
+    max_score = rules.max_score
+    if exact:
+        one = fractions.Fraction(1)
+        values = Values(dice_count, lambda s: -one, rules)
+    else:
+        one = 1.0
+        values = ArrayValues(dice_count, lambda s: -one, rules=rules)
+    iterations = [0 for s in range(max_score + 1)]
+    for remaining_dice in range(1, dice_count + 1):
+        values.set_value(remaining_dice, max_score, 0, -one)
+    u = 0 * one
+    work = ScoreWork(range(max_score - 1, -1, -1), progress, max_score)
+    for starting_score in range(max_score - 1, -1, -1):
+        if initial is not None:
+            u = initial[starting_score] * one
+        while True:
+            values.set_utility(starting_score, u - one)
+            slope = fill_out_turn(dice_count, sides, starting_score, values)
+            iterations[starting_score] += 1
+            f = values.play(dice_count, starting_score, 0)
+            # F(y) = f + slope * (y - (u - 1)); solve u' = F(u' - 1).
+            assert slope < 1
+            u_next = (f - slope * u) / (1 - slope)
+            if abs(u_next - u) <= tolerance:
+                break
+            u = u_next
+        work.done(starting_score)
+    return values, optimizing_strategy(dice_count, values), iterations
+
+
+def compute_turns(dice_count, sides, strategy, rules=DEFAULT_RULES):
+    """
+    The exact expected number of turns that "strategy" needs to reach
+    the goal, which is what play_game counts.
+
+    As in solve_turns, the value of a turn started at s is an affine
+    function F(y) of the worth y of ending it at s, but for a fixed
+    strategy it is a single affine function, so F(0) and F(1) give it
+    and u(s) = F(u(s) - 1) is solved directly.
+
+    A strategy that stops as soon as it has 150 points, even when the
+    rules give it no points for that, in a game to 1000:
+
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> def cautious(counter, starting_score, current_score, actions):
+    ...     i = max(range(len(actions)), key=lambda i: actions[i][1])
+    ...     reroll_dice, add_score = actions[i]
+    ...     return i, not reroll_dice or current_score + add_score < 3
+    >>> expected = compute_turns(3, 6, cautious, rules)
+    >>> round(float(expected), 4)
+    25.6937
+    >>> simulator = Simulator(3, 6, cautious, seed=1, rules=rules)
+    >>> lo, hi = simulator.play_games(4000).confidence_interval()
+    >>> lo < expected < hi
+    True
+    """
+    max_score = rules.max_score
+    one = fractions.Fraction(1)
+    values = Values(dice_count, lambda s: -one, rules)
+    for starting_score in range(max_score - 1, -1, -1):
+        f = []
+        for y in (0, 1):
+            values.set_utility(starting_score, y * one)
+            for current_score in range(max_score - starting_score - 1, -1, -1):
+                for remaining_dice in range(1, dice_count + 1):
+                    v = compute_values_single(
+                        dice_count,
+                        sides,
+                        remaining_dice,
+                        starting_score,
+                        current_score,
+                        strategy,
+                        values,
+                    )
+                    values.set_value(remaining_dice, starting_score, current_score, v)
+            f.append(values.play(dice_count, starting_score, 0))
+        # F(y) = f[0] + slope * y; solve u = F(u - 1).
+        slope = f[1] - f[0]
+        assert slope < 1
+        u = (f[0] - slope) / (1 - slope)
+        values.set_utility(starting_score, u - one)
+    return -values.utility(0) - 1
+
+
 def value(dice_count, sides, utility):
     return solve_game(dice_count, sides, utility)[0].play(dice_count, 0, 0)
 
@@ -308,27 +1196,28 @@ def compute_strategy(dice_count, sides, utility):
     return solve_game(dice_count, sides, utility)[1]
 
 
-def play_game(dice_count, sides, strategy):
+def play_game(dice_count, sides, strategy, rules=DEFAULT_RULES):
     reroll_dice = dice_count
     starting_score = current_score = 0
     restarts = 0
-    while starting_score < 10000 // 50:
+    while starting_score < rules.max_score:
         counter = collections.Counter(
             [random.randrange(sides) for _ in range(reroll_dice)]
         )
         print(
             "Starting score: %4d  Current score: %4d  You roll: %s"
             % (
-                50 * starting_score,
-                50 * current_score,
+                rules.unit * starting_score,
+                rules.unit * current_score,
                 sorted(a + 1 for a in counter.elements()),
             )
         )
-        a = list(actions(counter))
+        a = list(action_table(sides, dice_count, rules)[histogram(counter, sides)])
         if not a:
             print("Too bad!")
             restarts += 1
             current_score = 0
+            reroll_dice = dice_count
             continue
         action_index, do_continue = strategy(counter, starting_score, current_score, a)
         reroll_dice, keep_score = a[action_index]
@@ -336,17 +1225,341 @@ def play_game(dice_count, sides, strategy):
             print("You can't stop with 0 dice, cheater!")
             raise Exception("Cheater")
         current_score += keep_score
-        if do_continue:
+        # Reaching the goal ends the game, as in Values.play.
+        if do_continue and starting_score + current_score < rules.max_score:
             reroll_dice = reroll_dice or dice_count
             print("You reroll %s dice" % reroll_dice)
         else:
-            starting_score, current_score = starting_score + current_score, 0
+            starting_score = end_turn(starting_score, current_score, rules)
+            current_score = 0
             restarts += 1
             print("Next turn")
             reroll_dice = dice_count
     return restarts
 
 
+class Statistics(object):
+    """
+    Running count, sum, sum of squares and histogram of a sample.
+    Statistics of disjoint samples can be merged.
+
+    >>> s = Statistics()
+    >>> for x in [1, 2, 3]:
+    ...     s.add(x)
+    >>> t = Statistics()
+    >>> t.add(4)
+    >>> s.merge(t)
+    >>> s.count, s.mean(), s.variance()
+    (4, 2.5, 1.6666666666666667)
+    >>> lo, hi = s.confidence_interval()
+    >>> round(lo, 3), round(hi, 3)
+    (1.235, 3.765)
+    >>> sorted(s.histogram.items())
+    [(1, 1), (2, 1), (3, 1), (4, 1)]
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+        self.histogram = collections.Counter()
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        self.total_squares += x * x
+        self.histogram[x] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        self.histogram.update(other.histogram)
+
+    def mean(self):
+        return self.total / self.count
+
+    def variance(self):
+        """The unbiased sample variance."""
+        if self.count < 2:
+            return math.inf
+        n = self.count
+        return (self.total_squares - self.total * self.total / n) / (n - 1)
+
+    def confidence_interval(self, z=1.96):
+        """The normal approximation confidence interval of the mean."""
+        half_width = z * math.sqrt(self.variance() / self.count)
+        return self.mean() - half_width, self.mean() + half_width
+
+
+class Simulator(object):
+    """
+    Headless play_game for many games. Rolls are drawn as indices into
+    outcome_actions in batches with one call to Random.choices, and
+    the strategy's decisions are memoized so that a deterministic
+    strategy is called once per distinct situation. Like StrategyTable,
+    the memo is a dense array of small ints, allocated one row of
+    outcomes times current scores at a time for each number of dice and
+    starting score that play reaches, so it never holds more than one
+    entry per state of the game. Pass memoize=False for a randomized
+    strategy. The rolls are drawn from "rng", or a new
+    random.Random(seed); pass the same rng to a randomized strategy so
+    that reseed covers its choices as well.
+
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> def strategy(outcome, starting_score, current_score, actions):
+    ...     best = max(range(len(actions)), key=lambda i: actions[i][1])
+    ...     return best, current_score < 10 or not actions[best][0]
+    >>> def simulate(seed):
+    ...     statistics = Simulator(6, 6, strategy, seed, rules=rules).play_games(200)
+    ...     return statistics.count, statistics.mean(), statistics.variance()
+    >>> simulate(1) == simulate(1)
+    True
+    >>> simulate(1) == simulate(2)
+    False
+    """
+
+    def __init__(
+        self,
+        dice_count,
+        sides,
+        strategy,
+        seed=None,
+        memoize=True,
+        rules=DEFAULT_RULES,
+        rng=None,
+    ):
+        self.dice_count = dice_count
+        self.sides = sides
+        self.rules = rules
+        self.strategy = strategy
+        self.random = random.Random(seed) if rng is None else rng
+        self.memoize = memoize
+        self._outcomes = [None] + [
+            outcome_actions(sides, r, rules) for r in range(1, dice_count + 1)
+        ]
+        self._cum_weights = [None] + [
+            list(itertools.accumulate(m for c, m, a in self._outcomes[r]))
+            for r in range(1, dice_count + 1)
+        ]
+        self._draws = [[] for r in range(dice_count + 1)]
+        self._decisions = [[None] * rules.max_score for r in range(dice_count + 1)]
+
+    def reseed(self, seed):
+        self.random.seed(seed)
+        self._draws = [[] for r in range(self.dice_count + 1)]
+
+    def roll(self, remaining_dice):
+        """Draw the index of an outcome of rolling remaining_dice dice."""
+        draws = self._draws[remaining_dice]
+        if not draws:
+            draws.extend(
+                self.random.choices(
+                    range(len(self._outcomes[remaining_dice])),
+                    cum_weights=self._cum_weights[remaining_dice],
+                    k=4096,
+                )
+            )
+        return draws.pop()
+
+    def decide(self, remaining_dice, i, starting_score, current_score):
+        h, multiplicity, a = self._outcomes[remaining_dice][i]
+        if self.memoize:
+            # Entries are 1 + 2 * action_index + do_continue, and 0 if unset.
+            width = self.rules.max_score - starting_score
+            table = self._decisions[remaining_dice][starting_score]
+            if table is None:
+                size = len(self._outcomes[remaining_dice]) * width
+                table = array.array("H", bytes(2 * size))
+                self._decisions[remaining_dice][starting_score] = table
+            code = table[i * width + current_score]
+            if code:
+                return a[(code - 1) >> 1], bool((code - 1) & 1)
+        instrument.count("thousand.Simulator.decisions")
+        action_index, do_continue = self.strategy(
+            histogram_counter(h), starting_score, current_score, list(a)
+        )
+        if self.memoize:
+            table[i * width + current_score] = 1 + 2 * action_index + bool(do_continue)
+        return a[action_index], do_continue
+
+    def play_game(self):
+        """Same as play_game, but silent. Returns the number of turns."""
+        max_score = self.rules.max_score
+        reroll_dice = self.dice_count
+        starting_score = current_score = 0
+        restarts = 0
+        while starting_score < max_score:
+            i = self.roll(reroll_dice)
+            if not self._outcomes[reroll_dice][i][2]:
+                restarts += 1
+                current_score = 0
+                reroll_dice = self.dice_count
+                continue
+            (reroll_dice, keep_score), do_continue = self.decide(
+                reroll_dice, i, starting_score, current_score
+            )
+            if not reroll_dice and not do_continue:
+                raise Exception("Cheater")
+            current_score += keep_score
+            if do_continue and starting_score + current_score < max_score:
+                reroll_dice = reroll_dice or self.dice_count
+            else:
+                starting_score = end_turn(starting_score, current_score, self.rules)
+                current_score = 0
+                restarts += 1
+                reroll_dice = self.dice_count
+        return restarts
+
+    def play_games(self, games, statistics=None):
+        if statistics is None:
+            statistics = Statistics()
+        instrument.count("thousand.Simulator.games", games)
+        for _ in range(games):
+            statistics.add(self.play_game())
+        return statistics
+
+
+def named_strategy(
+    dice_count, sides, name, rules=DEFAULT_RULES, rng=random, use_cache=True
+):
+    """
+    The strategy called "optimal", "max" or "random", as (strategy,
+    memoize) for Simulator. The optimal strategy comes from the cache,
+    or is solved again with use_cache=False, and the random strategy
+    draws from "rng".
+    """
+    if name == "max":
+        return functools.partial(max_strategy, rules=rules), True
+    elif name == "random":
+        return functools.partial(random_strategy, rng=rng), False
+    elif name == "optimal":
+        if use_cache:
+            values, strategy = cached_solve_turns(dice_count, sides, rules=rules)
+        else:
+            values, strategy, iterations = solve_turns(dice_count, sides, rules=rules)
+        return strategy, True
+    raise ValueError("Unknown strategy %r" % (name,))
+
+
+# Simulators kept by each worker process of simulate_parallel,
+# so the decision tables are reused between tasks.
+_simulators: dict[tuple, Simulator] = {}
+
+
+def simulate_chunk(
+    dice_count,
+    sides,
+    strategy_name,
+    seed,
+    task,
+    games,
+    rules=DEFAULT_RULES,
+    use_cache=True,
+):
+    key = (dice_count, sides, strategy_name, rules)
+    if key not in _simulators:
+        rng = random.Random()
+        strategy, memoize = named_strategy(
+            dice_count, sides, strategy_name, rules, rng, use_cache
+        )
+        _simulators[key] = Simulator(
+            dice_count, sides, strategy, memoize=memoize, rules=rules, rng=rng
+        )
+    simulator = _simulators[key]
+    # Every task has its own stream of random numbers.
+    simulator.reseed("%s-%s" % (seed, task))
+    return simulator.play_games(games)
+
+
+def simulate_parallel(
+    dice_count,
+    sides,
+    strategy_name,
+    ci_width,
+    seed=None,
+    processes=None,
+    chunk_games=1000,
+    max_games=None,
+    rules=DEFAULT_RULES,
+    use_cache=True,
+):
+    """
+    Play games in chunks of chunk_games in a process pool, merging the
+    Statistics of each chunk as it arrives, until the 95% confidence
+    interval of the mean is at most ci_width wide (or max_games have been
+    played). The strategy is given by name, see named_strategy; with
+    use_cache=False, each worker solves the optimal strategy itself.
+    With a seed, the chunks are reproducible, though which chunks are
+    merged before the interval is narrow enough may vary. No more than
+    max_games are played, so stopping at max_games is reproducible:
+
+    >>> rules = Rules(goal=1000, endgame=800, opening=300)
+    >>> def simulate():
+    ...     stats = simulate_parallel(
+    ...         3, 6, "optimal", 0, seed=1, processes=1, chunk_games=300,
+    ...         max_games=1000, rules=rules, use_cache=False,
+    ...     )
+    ...     return stats.count, sorted(stats.histogram.items())
+    >>> first = simulate()
+    >>> first[0]
+    1000
+    >>> simulate() == first
+    True
+    """
+    if seed is None:
+        seed = random.randrange(2**64)
+    if strategy_name == "optimal" and use_cache:
+        # Solve once here, so that the workers only read the cache
+        # instead of all solving the game and writing the same file.
+        cached_solve_turns(dice_count, sides, rules=rules)
+    processes = processes or os.cpu_count() or 1
+    stats = Statistics()
+    task = 0
+
+    def done():
+        if max_games is not None and stats.count >= max_games:
+            return True
+        if stats.count < 2:
+            return False
+        lo, hi = stats.confidence_interval()
+        return hi - lo <= ci_width
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        pending = set()
+        submitted = 0
+        while not done():
+            while len(pending) < 2 * processes:
+                games = chunk_games
+                if max_games is not None:
+                    games = min(games, max_games - submitted)
+                if games <= 0:
+                    break
+                pending.add(
+                    executor.submit(
+                        simulate_chunk,
+                        dice_count,
+                        sides,
+                        strategy_name,
+                        seed,
+                        task,
+                        games,
+                        rules,
+                        use_cache,
+                    )
+                )
+                submitted += games
+                task += 1
+            finished, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                stats.merge(future.result())
+        for future in pending:
+            future.cancel()
+    return stats
+
+
 def my_utility(restarts):
     return restarts
 
@@ -378,49 +1591,129 @@ def input_roll(dice_count, sides, input=input):
         return roll
 
 
+def print_statistics(stats):
+    lo, hi = stats.confidence_interval()
+    print(
+        "Played %s games, average utility %.4f (variance %.4f, "
+        % (stats.count, stats.mean(), stats.variance())
+        + "95%% confidence interval %.4f to %.4f)" % (lo, hi)
+    )
+
+
+def parse_rules(s):
+    """
+    The Rules given by the fields in the JSON object "s", for --rules.
+
+    >>> parse_rules('{"goal": 5000}').max_score
+    100
+    """
+    try:
+        fields = json.loads(s)
+        if not isinstance(fields, dict):
+            raise ValueError("expected a JSON object")
+        unknown = sorted(set(fields) - set(Rules._fields))
+        if unknown:
+            raise ValueError("unknown field %r" % unknown[0])
+        return Rules(**fields).check()
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-p", "--infiniplay", action="store_true")
     parser.add_argument("-r", "--random", action="store_true")
     parser.add_argument("-m", "--max", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("-s", "--simulate", type=int, metavar="GAMES")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--ci-width", type=float)
+    parser.add_argument("-j", "--processes", type=int)
+    parser.add_argument(
+        "--instrument", action="store_true", help="print counters and timers at exit"
+    )
+    parser.add_argument(
+        "--rules",
+        type=parse_rules,
+        default=DEFAULT_RULES,
+        help="fields of Rules to change as JSON, e.g. '{\"goal\": 5000}'",
+    )
     args = parser.parse_args()
-
-    dice_count = 6
-    sides = 6
-
-    if args.max:
-        strategy = max_strategy
-        expected_utility = 0
-    elif args.random:
-        strategy = random_strategy
-        expected_utility = 0
-    else:
-        print(
-            "Compute utility-maximizing strategy for %d %d-sided dice..."
-            % (dice_count, sides)
-        )
-        values, strategy = solve_game(dice_count, sides, my_utility)
-        expected_utility = values.play(dice_count, 0, 0)
-
-    # def is_win(score: int) -> bool:
-    #     return score >= 10000 // 50
-
-    if args.infiniplay:
-        v = expected_utility
-        print("Expected utility: %s = %.2f" % (v, float(v)))
-        # print("Probability of winning: {:.2%}".format(
-        #     compute_value(dice_count, sides, strategy, is_win,
-        #                   operator.truediv)))
-        sum_utility = 0
-        n_tries = 0
-        while True:
-            s = play_game(dice_count, sides, strategy)
-            sum_utility += my_utility(s)
-            n_tries += 1
+    rules = args.rules
+    rng = random.Random(args.seed)
+    with instrument.dump_on_exit(args.instrument):
+        dice_count = 6
+        sides = 6
+
+        if args.ci_width:
+            name = "max" if args.max else "random" if args.random else "optimal"
+            stats = simulate_parallel(
+                dice_count,
+                sides,
+                name,
+                args.ci_width,
+                args.seed,
+                args.processes,
+                rules=rules,
+                use_cache=not args.no_cache,
+            )
+            print_statistics(stats)
+            return
+
+        if args.max:
+            strategy = functools.partial(max_strategy, rules=rules)
+            expected_utility = 0
+        elif args.random:
+            strategy = functools.partial(random_strategy, rng=rng)
+            expected_utility = 0
+        else:
             print(
-                "Utility: %s. Played %s games, " % (my_utility(s), n_tries)
-                + "average utility %.2f" % (sum_utility / n_tries)
+                "Compute turn-minimizing strategy for %d %d-sided dice..."
+                % (dice_count, sides)
             )
+            progress = instrument.ProgressPrinter("Fill out")
+            if args.no_cache:
+                values, strategy, iterations = solve_turns(
+                    dice_count, sides, progress=progress, rules=rules
+                )
+            else:
+                values, strategy = cached_solve_turns(
+                    dice_count, sides, progress=progress, rules=rules
+                )
+            # values.play(dice_count, 0, 0) is minus the expected number of
+            # turns, and my_utility counts the turns of a game.
+            expected_utility = -values.play(dice_count, 0, 0)
+
+        # def is_win(score: int) -> bool:
+        #     return score >= rules.max_score
+
+        if args.simulate:
+            simulator = Simulator(
+                dice_count,
+                sides,
+                strategy,
+                memoize=not args.random,
+                rules=rules,
+                rng=rng,
+            )
+            stats = simulator.play_games(args.simulate)
+            print_statistics(stats)
+        elif args.infiniplay:
+            v = expected_utility
+            print("Expected utility: %s = %.2f" % (v, float(v)))
+            # print("Probability of winning: {:.2%}".format(
+            #     compute_value(dice_count, sides, strategy, is_win,
+            #                   operator.truediv)))
+            sum_utility = 0
+            n_tries = 0
+            while True:
+                s = play_game(dice_count, sides, strategy, rules)
+                sum_utility += my_utility(s)
+                n_tries += 1
+                print(
+                    "Utility: %s. Played %s games, " % (my_utility(s), n_tries)
+                    + "average utility %.2f" % (sum_utility / n_tries)
+                )
 
 
 if __name__ == "__main__":